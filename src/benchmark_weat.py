@@ -0,0 +1,228 @@
+# Microbenchmarks of the WEAT kernels on synthetic embeddings, so changes to
+# seat_bench.weat can be compared against a baseline without any model.
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+from seat_bench import weat
+
+parser = argparse.ArgumentParser(description="Benchmarks the WEAT kernels.")
+parser.add_argument(
+    "--sizes",
+    action="store",
+    type=int,
+    nargs="+",
+    default=[8, 32, 128, 512, 2000],
+    help="Number of words in each target and attribute set.",
+)
+parser.add_argument(
+    "--dims",
+    action="store",
+    type=int,
+    nargs="+",
+    default=[50, 300, 1024],
+    help="Embedding dimensions.",
+)
+parser.add_argument(
+    "--n_samples",
+    action="store",
+    type=int,
+    nargs="+",
+    default=[1000, 10000],
+    help="Numbers of permutation test samples and bootstrap replicates.",
+)
+parser.add_argument(
+    "--max_exact_partitions",
+    action="store",
+    type=int,
+    default=10**7,
+    help="Largest number of partitions for which the exact permutation test is "
+    "benchmarked; larger sizes skip it.",
+)
+parser.add_argument(
+    "--repeat",
+    action="store",
+    type=int,
+    default=5,
+    help="Number of timed runs of each benchmark.",
+)
+parser.add_argument(
+    "--seed",
+    action="store",
+    type=int,
+    default=0,
+    help="Random seed of the synthetic embeddings and of the samples.",
+)
+parser.add_argument(
+    "--output",
+    action="store",
+    type=str,
+    default=None,
+    help="JSON file the timings are written to.",
+)
+parser.add_argument(
+    "--baseline",
+    action="store",
+    type=str,
+    default=None,
+    help="JSON file written by an earlier run to compare the timings with.",
+)
+parser.add_argument(
+    "--max_slowdown",
+    action="store",
+    type=float,
+    default=None,
+    help="Exit with an error if a benchmark is this many times slower than "
+    "its baseline.",
+)
+
+
+def _timeit(fn, repeat):
+    """Return the timings of repeat calls of fn in seconds, after a warm-up
+    call. The kernels' progress output is discarded.
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def _benchmarks(sizes, dims, n_samples, seed, max_exact_partitions):
+    """Yield the parameters and the callable of each benchmark.
+
+    The similarity kernels depend on the size and dimension of the sets, the
+    sampling kernels on the size and the number of samples. The exact
+    permutation test only depends on the size, and only runs for sizes with
+    at most max_exact_partitions partitions.
+    """
+    rng = np.random.default_rng(seed)
+    for size in sizes:
+        X, Y = range(size), range(size, 2 * size)
+        A, B = range(size), range(size, 2 * size)
+        cossims = None
+        for dim in dims:
+            XY = rng.standard_normal((2 * size, dim), dtype=np.float32)
+            AB = rng.standard_normal((2 * size, dim), dtype=np.float32)
+            cossims = weat.construct_cossim_lookup(XY, AB)
+            params = {"size": size, "dim": dim, "n_samples": None}
+            yield "construct_cossim_lookup", params, lambda XY=XY, AB=AB: (
+                weat.construct_cossim_lookup(XY, AB)
+            )
+            yield "construct_centroid_lookup", params, lambda XY=XY, AB=AB: (
+                weat.construct_centroid_lookup(XY, AB, A, B)
+            )
+            yield "s_wAB", params, lambda cossims=cossims: weat.s_wAB(A, B, cossims)
+            yield "effect_size", params, lambda cossims=cossims: weat.effect_size(
+                X, Y, A, B, cossims
+            )
+
+        if math.comb(2 * size, size) <= max_exact_partitions:
+            params = {"size": size, "dim": None, "n_samples": None}
+            yield "p_val_permutation_test_exact", params, lambda: (
+                weat.p_val_permutation_test(
+                    X,
+                    Y,
+                    A,
+                    B,
+                    0,
+                    cossims,
+                    max_exact_partitions=max_exact_partitions,
+                )
+            )
+
+        for n in n_samples:
+            params = {"size": size, "dim": None, "n_samples": n}
+            yield "p_val_permutation_test", params, lambda n=n: (
+                weat.p_val_permutation_test(
+                    X, Y, A, B, n, cossims, rng=np.random.default_rng(seed)
+                )
+            )
+            yield "p_val_permutation_test_parametric", params, lambda n=n: (
+                weat.p_val_permutation_test(
+                    X,
+                    Y,
+                    A,
+                    B,
+                    n,
+                    cossims,
+                    parametric=True,
+                    rng=np.random.default_rng(seed),
+                )
+            )
+            yield "effect_size_ci", params, lambda n=n: weat.effect_size_ci(
+                X, Y, A, B, cossims, n_boot=n, rng=np.random.default_rng(seed)
+            )
+
+
+def _key(result):
+    return (result["kernel"], result["size"], result["dim"], result["n_samples"])
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = {_key(result): result for result in json.load(f)["results"]}
+
+    results = []
+    slow = []
+    for kernel, params, fn in _benchmarks(
+        args.sizes, args.dims, args.n_samples, args.seed, args.max_exact_partitions
+    ):
+        times = _timeit(fn, args.repeat)
+        result = {
+            "kernel": kernel,
+            **params,
+            "min_s": min(times),
+            "median_s": statistics.median(times),
+        }
+        line = (
+            f"{kernel:<33} size={params['size']:<5} dim={str(params['dim']):<5} "
+            f"n_samples={str(params['n_samples']):<6} "
+            f"median={result['median_s'] * 1e3:10.3f} ms"
+        )
+        if _key(result) in baseline:
+            result["baseline_median_s"] = baseline[_key(result)]["median_s"]
+            result["speedup"] = result["baseline_median_s"] / result["median_s"]
+            line += f"  speedup={result['speedup']:.2f}x"
+            if args.max_slowdown and 1 / result["speedup"] > args.max_slowdown:
+                slow.append(_key(result))
+        print(line)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "environment": {
+                        "python": platform.python_version(),
+                        "numpy": np.__version__,
+                        "machine": platform.machine(),
+                        "processor": platform.processor(),
+                    },
+                    "repeat": args.repeat,
+                    "seed": args.seed,
+                    "results": results,
+                },
+                f,
+                indent=4,
+            )
+        print(f"Wrote {args.output}")
+
+    if slow:
+        print(f"Slower than baseline by more than {args.max_slowdown}x: {slow}")
+        sys.exit(1)
@@ -0,0 +1,63 @@
+# Serves ad-hoc WEAT and SEAT queries with one embedding model kept in memory,
+# so each query pays for its encodings and its test but not for a model load.
+
+import argparse
+
+from seat_bench import backends
+from seat_bench.instrumentation import log, set_quiet
+from seat_bench.server import serve
+
+parser = argparse.ArgumentParser(description="Serves WEAT and SEAT queries.")
+parser.add_argument(
+    "--embedding_model",
+    action="store",
+    type=str,
+    default="glove",
+    choices=backends.available_backends(),
+    help="Embedding model loaded once and used for every query.",
+)
+parser.add_argument(
+    "--host",
+    action="store",
+    type=str,
+    default="127.0.0.1",
+    help="Address the server listens on.",
+)
+parser.add_argument(
+    "--port",
+    action="store",
+    type=int,
+    default=8000,
+    help="Port the server listens on.",
+)
+parser.add_argument(
+    "--elmo_batch_size",
+    action="store",
+    type=int,
+    default=64,
+    help="Maximum number of sentences per ELMo forward pass.",
+)
+parser.add_argument(
+    "--batch_window",
+    action="store",
+    type=float,
+    default=0.005,
+    help="Seconds to wait for concurrent queries to share an encode call.",
+)
+parser.add_argument(
+    "--quiet",
+    action="store_true",
+    help="Do not print progress and request messages.",
+)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    set_quiet(args.quiet)
+
+    log(f"Loading {args.embedding_model}")
+    if args.embedding_model == "elmo":
+        backend = backends.load_backend("elmo", max_batch_size=args.elmo_batch_size)
+    else:
+        backend = backends.load_backend(args.embedding_model)
+    serve(backend, args.host, args.port, args.batch_window)
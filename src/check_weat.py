@@ -0,0 +1,61 @@
+# Checks the exact permutation test engines of seat_bench.weat against a plain
+# enumeration of every partition with itertools.combinations.
+
+import argparse
+import itertools
+
+import numpy as np
+from seat_bench import weat
+
+parser = argparse.ArgumentParser(description="Checks the exact test engines.")
+parser.add_argument(
+    "--max_size",
+    action="store",
+    type=int,
+    default=7,
+    help="Largest number of words in each target set.",
+)
+parser.add_argument(
+    "--n_jobs",
+    action="store",
+    type=int,
+    default=2,
+    help="Number of processes of the sharded engine.",
+)
+parser.add_argument(
+    "--seed",
+    action="store",
+    type=int,
+    default=0,
+    help="Random seed of the scores.",
+)
+
+
+def _naive_counts(values, size, s):
+    """Return the counts of `weat._exact_test_counts` computed by scoring
+    every partition.
+    """
+    total_true = 0
+    total_equal = 0
+    total = 0
+    for X_i in itertools.combinations(range(len(values)), size):
+        si = values[list(X_i)].sum()
+        total_true += int(si >= s)
+        total_equal += int(si == s)
+        total += 1
+    return total_true, total_equal, total
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for size in range(1, args.max_size + 1):
+        # Small integer scores make tied partitions common.
+        values = rng.integers(-3, 4, 2 * size)
+        s = values[:size].sum()
+        counts = _naive_counts(values, size, s)
+        assert weat._exact_test_counts(values, size, s) == counts
+        assert weat._exact_test_counts_parallel(values, size, s, args.n_jobs) == counts
+        print(f"size={size}: {counts[0]} of {counts[2]} partitions score >= s")
+    print("Exact test engines agree with itertools.combinations")
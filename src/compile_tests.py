@@ -0,0 +1,32 @@
+# Compiles the WEAT or SEAT tests of a data directory into one binary suite,
+# which the runners load with --suite instead of parsing every test file.
+
+import argparse
+import os
+
+from seat_bench.seat import TEST_EXT
+from seat_bench.test_suite import compile_suite
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description="Compiles a directory of tests.")
+parser.add_argument(
+    "--data_dir",
+    action="store",
+    type=str,
+    default=f"{DIRECTORY}/data/seat/hi/lang_spec",
+    help="Directory of the test files.",
+)
+parser.add_argument(
+    "--output",
+    action="store",
+    type=str,
+    default=None,
+    help="Path of the compiled suite, `<data_dir>.suite` by default.",
+)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    path = compile_suite(args.data_dir, TEST_EXT, args.output)
+    print(f"Wrote {path}")
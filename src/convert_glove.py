@@ -0,0 +1,29 @@
+# Converts the GloVe text embeddings into the binary store that the SEAT and
+# WEAT runners memory-map instead of parsing the text file on every run.
+
+import argparse
+
+from seat_bench.embedding_store import convert_embeddings
+from seat_bench.backends import GLOVE_300_PATH
+
+parser = argparse.ArgumentParser(description="Converts GloVe text embeddings.")
+parser.add_argument(
+    "--glove_path",
+    action="store",
+    type=str,
+    default=GLOVE_300_PATH,
+    help="GloVe embeddings in text format.",
+)
+parser.add_argument(
+    "--limit",
+    action="store",
+    type=int,
+    default=500000,
+    help="Number of lines of the text file to convert.",
+)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    prefix = convert_embeddings(args.glove_path, limit=args.limit)
+    print(f"Wrote {prefix}.npy and {prefix}.vocab.txt")
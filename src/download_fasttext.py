@@ -0,0 +1,11 @@
+# Data source : https://fasttext.cc/docs/en/crawl-vectors.html
+
+import fasttext.util
+
+
+def download_fasttext_hindi_model():
+    fasttext.util.download_model("hi", if_exists="ignore")
+
+
+if __name__ == "__main__":
+    download_fasttext_hindi_model()
@@ -1,3 +1,6 @@
+import argparse
+import hashlib
+import itertools
 import json
 import os
 import re
@@ -7,6 +10,39 @@ WEAT_DATA = os.path.join(DIRECTORY, "data", "weat", "hi", "lang_spec")
 SEAT_DATA = os.path.join(DIRECTORY, "data", "seat", "hi", "lang_spec")
 SEAT_TEMPLATES = os.path.join(DIRECTORY, "data", "seat", "hi", "templates.jsonl")
 TEST_EXT = ".jsonl"
+# Content hashes of the inputs of each generated file, kept next to the
+# generated files so unchanged tests are not regenerated.
+MANIFEST = ".generated.json"
+# Changing the layout of the generated files invalidates every hash.
+FORMAT_VERSION = 1
+
+parser = argparse.ArgumentParser(description="Generates SEAT data.")
+parser.add_argument(
+    "--weat_dir",
+    action="store",
+    type=str,
+    default=WEAT_DATA,
+    help="Directory of the WEAT word lists.",
+)
+parser.add_argument(
+    "--seat_dir",
+    action="store",
+    type=str,
+    default=SEAT_DATA,
+    help="Directory the SEAT sentences are written to.",
+)
+parser.add_argument(
+    "--templates",
+    action="store",
+    type=str,
+    default=SEAT_TEMPLATES,
+    help="File with the sentence templates of each word type.",
+)
+parser.add_argument(
+    "--force",
+    action="store_true",
+    help="Regenerate every test, even if its inputs did not change.",
+)
 
 
 def _test_sort_key(test):
@@ -24,44 +60,129 @@ def _test_sort_key(test):
     return key
 
 
-def _load_json(sent_file):
-    """Load from json. We expect a certain format later, so do some post processing."""
-    print(f"Loading {sent_file}...")
-    all_data = json.load(open(sent_file, "r"))
-    data = {}
-    for k, v in all_data.items():
-        examples = v["examples"]
-        data[k] = examples
-        v["examples"] = examples
+def _input_hash(source, templates):
+    """Return the hash of a WEAT file's contents and of the templates of the
+    word types it uses.
+    """
+    digest = hashlib.sha1(f"{FORMAT_VERSION}\0".encode())
+    digest.update(source)
+    digest.update(json.dumps(templates, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _dumps(value, indent):
+    """Encode value as `json.dump(..., indent=4)` would at the given depth."""
+    return json.dumps(value, indent=4, ensure_ascii=False).replace(
+        "\n", "\n" + " " * indent
+    )
+
+
+def _write_list(f, items, indent):
+    """Write the strings yielded by items as an indented JSON list."""
+    items = iter(items)
+    first = next(items, None)
+    if first is None:
+        f.write("[]")
+        return
+    pad = " " * (indent + 4)
+    f.write(f"[\n{pad}{_dumps(first, 0)}")
+    for item in items:
+        f.write(f",\n{pad}{_dumps(item, 0)}")
+    f.write("\n" + " " * indent + "]")
+
 
-    return all_data
+def _write_test(f, encs, templates):
+    """Write encs with the sentences of every category whose type has
+    templates, in the layout of `json.dump(..., indent=4)`.
+
+    Sentences are expanded from the product of templates and examples while
+    they are written, so they are never held in memory.
+    """
+    f.write("{")
+    for i, (item, enc) in enumerate(encs.items()):
+        f.write(",\n" if i else "\n")
+        f.write(f"    {_dumps(item, 0)}: {{")
+        enc = dict(enc)
+        if enc["type"] in templates:
+            enc["templates"] = templates[enc["type"]]
+            enc["sentences"] = None
+        for j, (key, value) in enumerate(enc.items()):
+            f.write(",\n" if j else "\n")
+            f.write(f"        {_dumps(key, 0)}: ")
+            if key == "sentences" and enc["type"] in templates:
+                sentences = (
+                    template.replace("_", example)
+                    for template, example in itertools.product(
+                        enc["templates"], enc["examples"]
+                    )
+                )
+                _write_list(f, sentences, 8)
+            else:
+                f.write(_dumps(value, 8))
+        f.write("\n    }")
+    f.write("\n}")
+
+
+def _save_manifest(path, manifest):
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(path + ".tmp", path)
 
 
-def generate_seat_data():
+def generate_seat_data(
+    weat_dir=WEAT_DATA, seat_dir=SEAT_DATA, templates_path=SEAT_TEMPLATES, force=False
+):
+    """Generate the SEAT sentences of every WEAT test in weat_dir.
+
+    A test is only regenerated when the contents of its WEAT file or the
+    templates of the word types it uses changed since it was last generated,
+    or when its output is missing.
+    """
     all_tests = sorted(
         [
             entry[: -len(TEST_EXT)]
-            for entry in os.listdir(WEAT_DATA)
+            for entry in os.listdir(weat_dir)
             if not entry.startswith(".") and entry.endswith(TEST_EXT)
         ],
         key=_test_sort_key,
     )
 
-    SEAT_templates = json.load(open(SEAT_TEMPLATES, "r"))
+    with open(templates_path, "r") as f:
+        SEAT_templates = json.load(f)
+
+    manifest_path = os.path.join(seat_dir, MANIFEST)
+    manifest = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    generated = 0
+    for test in all_tests:
+        weat_file = os.path.join(weat_dir, f"{test}{TEST_EXT}")
+        seat_file = os.path.join(seat_dir, f"sent-{test}{TEST_EXT}")
+        with open(weat_file, "rb") as f:
+            source = f.read()
+        encs = json.loads(source)
+        templates = {
+            enc["type"]: SEAT_templates[enc["type"]]
+            for enc in encs.values()
+            if enc["type"] in SEAT_templates
+        }
+        input_hash = _input_hash(source, templates)
+        if not force and manifest.get(test) == input_hash and os.path.isfile(seat_file):
+            continue
 
-    for i, test in enumerate(all_tests):
-        encs = _load_json(os.path.join(WEAT_DATA, f"{test}{TEST_EXT}"))
-        for item in encs.keys():
-            if encs[item]["type"] in SEAT_templates.keys():
-                encs[item]["templates"] = SEAT_templates[encs[item]["type"]]
-                encs[item]["sentences"] = []
-                for template in encs[item]["templates"]:
-                    for example in encs[item]["examples"]:
-                        encs[item]["sentences"].append(template.replace("_", example))
+        print(f"Generating {seat_file}...")
+        with open(seat_file + ".tmp", "w", encoding="utf-8") as f:
+            _write_test(f, encs, templates)
+        os.replace(seat_file + ".tmp", seat_file)
+        manifest[test] = input_hash
+        _save_manifest(manifest_path, manifest)
+        generated += 1
 
-        with open(os.path.join(SEAT_DATA, f"sent-{test}{TEST_EXT}"), "w") as f:
-            json.dump(encs, f, indent=4, ensure_ascii=False)
+    print(f"Generated {generated} of {len(all_tests)} tests")
 
 
 if __name__ == "__main__":
-    generate_seat_data()
+    args = parser.parse_args()
+    generate_seat_data(args.weat_dir, args.seat_dir, args.templates, args.force)
@@ -0,0 +1,204 @@
+# Runs a grid of WEAT and SEAT experiments across languages, word list modes
+# and embedding models on a pool of worker processes, writing each experiment
+# to the results/{seat,weat}/... layout of seat_test.py and weat_test.py.
+
+import argparse
+import os
+
+from seat_bench import backends
+from seat_bench.instrumentation import log, set_quiet
+from seat_bench.matrix import experiment_grid, run_matrix
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description="Runs a grid of experiments.")
+parser.add_argument(
+    "--persistent_dir",
+    action="store",
+    type=str,
+    default=DIRECTORY,
+    help="Directory where all persistent data will be stored.",
+)
+parser.add_argument(
+    "--kinds",
+    action="store",
+    nargs="+",
+    default=["weat", "seat"],
+    choices=["weat", "seat"],
+    help="Kinds of tests to run.",
+)
+parser.add_argument(
+    "--languages",
+    action="store",
+    nargs="+",
+    default=["hi"],
+    help="Languages of the tests, directories of data/weat and data/seat.",
+)
+parser.add_argument(
+    "--modes",
+    action="store",
+    nargs="+",
+    default=["lang_spec", "trans"],
+    choices=["lang_spec", "trans"],
+    help="Language specific or translation based word lists.",
+)
+parser.add_argument(
+    "--embedding_models",
+    action="store",
+    nargs="+",
+    default=["glove", "elmo"],
+    choices=backends.available_backends(),
+    help="Embedding models to use. ELMo only runs SEAT tests.",
+)
+parser.add_argument(
+    "--seeds",
+    action="store",
+    type=int,
+    nargs="+",
+    default=[0],
+    help="Random seeds of every experiment.",
+)
+parser.add_argument(
+    "--n_samples",
+    action="store",
+    type=int,
+    default=1000,
+    help="Number of permutation test samples used when estimating p-values "
+    "(exact test is used if there are fewer than this many permutations).",
+)
+parser.add_argument(
+    "--max_exact_partitions",
+    action="store",
+    type=int,
+    default=None,
+    help="Use the exact test whenever there are at most this many permutations, "
+    "even if there are more than n_samples.",
+)
+parser.add_argument(
+    "--parametric",
+    action="store_true",
+    help="Use parametric test (normal assumption) to compute p-values.",
+)
+parser.add_argument(
+    "--adaptive",
+    action="store_true",
+    help="Stop drawing permutation test samples once the p-value is clearly "
+    "above or below --alpha (at most n_samples are drawn).",
+)
+parser.add_argument(
+    "--alpha",
+    action="store",
+    type=float,
+    default=0.05,
+    help="Significance level used by the adaptive permutation test.",
+)
+parser.add_argument(
+    "--n_bootstrap",
+    action="store",
+    type=int,
+    default=1000,
+    help="Number of bootstrap replicates of the 95%% confidence interval of the "
+    "effect size (0 disables it).",
+)
+parser.add_argument(
+    "--bootstrap",
+    action="store",
+    type=str,
+    default="targets",
+    choices=["targets", "attributes", "both"],
+    help="Words resampled with replacement by the effect size bootstrap.",
+)
+parser.add_argument(
+    "--centroid",
+    action="store_true",
+    help="Score targets against the mean unit vector of each attribute set "
+    "instead of building the full cosine similarity matrix.",
+)
+parser.add_argument(
+    "--n_workers",
+    action="store",
+    type=int,
+    default=None,
+    help="Number of worker processes (all CPUs by default).",
+)
+parser.add_argument(
+    "--max_model_workers",
+    action="store",
+    nargs="*",
+    default=[],
+    metavar="MODEL=N",
+    help="Maximum number of workers holding a model at once, e.g. elmo=4 to "
+    "bound the memory used by ELMo (elmo=2 by default).",
+)
+parser.add_argument(
+    "--elmo_batch_size",
+    action="store",
+    type=int,
+    default=64,
+    help="Maximum number of sentences per ELMo forward pass.",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Skip tests already recorded in the streamed .jsonl results of each "
+    "experiment.",
+)
+parser.add_argument(
+    "--overwrite",
+    action="store_true",
+    help="Discard the results already in the .jsonl results of the "
+    "experiments. Without it or --resume, the grid stops rather than discard "
+    "them.",
+)
+parser.add_argument(
+    "--quiet",
+    action="store_true",
+    help="Do not print progress messages.",
+)
+
+
+def _parse_model_workers(pairs):
+    """Parse MODEL=N pairs into a `dict` mapping models to worker counts."""
+    limits = {}
+    for pair in pairs:
+        model, _, n = pair.partition("=")
+        if not n.isdigit() or int(n) < 1:
+            parser.error(f"--max_model_workers expects MODEL=N, got {pair}")
+        limits[model] = int(n)
+    return limits
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    set_quiet(args.quiet)
+
+    experiments = experiment_grid(
+        args.persistent_dir,
+        args.kinds,
+        args.languages,
+        args.modes,
+        args.embedding_models,
+    )
+    for experiment in experiments:
+        log(
+            f" - {experiment['experiment_id']}: {len(experiment['tests'])} tests "
+            f"in {experiment['data_dir']}"
+        )
+
+    run_matrix(
+        experiments,
+        n_workers=args.n_workers,
+        max_model_workers=_parse_model_workers(args.max_model_workers),
+        resume=args.resume,
+        overwrite=args.overwrite,
+        elmo_batch_size=args.elmo_batch_size,
+        seeds=args.seeds,
+        n_samples=args.n_samples,
+        max_exact_partitions=args.max_exact_partitions,
+        parametric=args.parametric,
+        adaptive=args.adaptive,
+        alpha=args.alpha,
+        n_bootstrap=args.n_bootstrap,
+        bootstrap=args.bootstrap,
+        centroid=args.centroid,
+    )
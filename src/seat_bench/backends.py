@@ -0,0 +1,276 @@
+import logging
+import os
+
+import numpy as np
+from seat_bench import embedding_store, encoding_cache
+from seat_bench.instrumentation import is_quiet, log
+
+ELMO_DIR = "elmo_models/hi"
+FASTTEXT_PATH = "cc.hi.300.bin"
+DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+GLOVE_50_PATH = os.path.join(DIRECTORY, "glove_models/hi/50/glove", "hi-d50-glove.txt")
+GLOVE_300_PATH = os.path.join(
+    DIRECTORY, "glove_models/hi/300/glove", "hi-d300-glove.txt"
+)
+
+# Backends of the embedding models, keyed by `embedding_model`. The libraries
+# a backend needs (fasttext, simple_elmo, tqdm) are only imported when its
+# model is loaded, so importing seat_bench works offline and stays cheap.
+_backends = {}
+
+
+class Backend:
+    """An embedding model that encodes batches of texts.
+
+    `encode_words` and `encode_sentences` map a list of texts to a contiguous
+    matrix whose row i encodes texts[i], so every backend can use its fastest
+    bulk path. New models are added by subclassing Backend and registering
+    the subclass with `register_backend`.
+    """
+
+    name = None
+    # Dimension of the encodings and layer configuration of the model, both
+    # part of the encoding cache key.
+    dim = None
+    layers = ""
+
+    def fingerprint(self):
+        """Return a string identifying the model's weights."""
+        return self.name
+
+    def encode_words(self, texts):
+        raise NotImplementedError(f"{self.name} does not encode words.")
+
+    def encode_sentences(self, texts):
+        raise NotImplementedError(f"{self.name} does not encode sentences.")
+
+
+def register_backend(name, backend):
+    """Register backend, a callable returning a `Backend`, under name."""
+    _backends[name] = backend
+
+
+def available_backends():
+    return sorted(_backends)
+
+
+def load_backend(name, **kwargs):
+    """Load the backend registered under name."""
+    if name not in _backends:
+        raise NotImplementedError("Embedding model not implemented.")
+    return _backends[name](**kwargs)
+
+
+def emb_matrix_maker(path_to_txt):
+    from tqdm import tqdm
+
+    words = []
+    vectors = []
+    for line in tqdm(embedding_store.read_lines(path_to_txt), disable=is_quiet()):
+        values = line.split(" ")
+        words.append(values[0])
+        vectors.append(np.asarray(values[1:], "float32"))
+    return embedding_store.EmbeddingStore(np.stack(vectors), words)
+
+
+def load_glove(path_to_txt=GLOVE_300_PATH, vocab=None):
+    """Load GloVe embeddings, memory-mapping the binary store converted from
+    path_to_txt (see convert_glove.py) when it exists and parsing the text
+    file otherwise.
+
+    When vocab is given, only the vectors of its words are loaded, from
+    every line of the text file.
+    """
+    if vocab is not None:
+        log(f"Loading {len(vocab)} words from {path_to_txt}...")
+        return embedding_store.load_embeddings_subset(path_to_txt, vocab)
+    prefix = embedding_store.store_prefix(path_to_txt)
+    if embedding_store.store_exists(prefix):
+        log(f"Loading {prefix}{embedding_store.MATRIX_EXT}...")
+        return embedding_store.load_embedding_store(prefix)
+    return emb_matrix_maker(path_to_txt)
+
+
+# Loaded fastText models keyed by (path, dim), shared by every runner in the
+# process until evicted with `evict_fasttext`.
+_fasttext_models = {}
+
+
+def load_fasttext(path=FASTTEXT_PATH, dim=300):
+    """Return the fastText model at path reduced to dim dimensions, loading it
+    only if it is not cached yet. The model is downloaded by
+    download_fasttext.py.
+    """
+    key = (path, dim)
+    if key not in _fasttext_models:
+        import fasttext
+        import fasttext.util
+
+        log(f"Loading {path}...")
+        model = fasttext.load_model(path)
+        if dim != model.get_dimension():
+            model = fasttext.util.reduce_model(model, dim)
+        _fasttext_models[key] = model
+    return _fasttext_models[key]
+
+
+def evict_fasttext(path=None, dim=None):
+    """Drop cached fastText models matching path and dim (None matches any)."""
+    for key in list(_fasttext_models):
+        if path in (None, key[0]) and dim in (None, key[1]):
+            del _fasttext_models[key]
+
+
+def load_elmo(path=ELMO_DIR, max_batch_size=64):
+    from simple_elmo import ElmoModel
+
+    logging.getLogger("simple_elmo").setLevel(logging.ERROR)
+    model = ElmoModel()
+    model.load(path, max_batch_size=max_batch_size)
+    return model
+
+
+def _glove_sentence_matrix(texts, embeddings):
+    """Encode texts as the mean of their GloVe word vectors, with out of
+    vocabulary words counted as zero vectors.
+
+    All texts are tokenized into one flat array of row ids with per-text
+    offsets, the rows are gathered from the embedding matrix in one indexing
+    operation and summed per text with `np.add.reduceat`.
+
+    Returns:
+        (encodings, oov_counts), an array with one encoding per text and the
+        number of out of vocabulary words in each text.
+    """
+    tokens = [text.split() for text in texts]
+    lengths = np.array([len(words) for words in tokens], dtype=np.int64)
+    ids = np.fromiter(
+        (embeddings.vocab.get(word, -1) for words in tokens for word in words),
+        dtype=np.int64,
+        count=lengths.sum(),
+    )
+    oov = ids < 0
+    vectors = np.zeros(
+        (len(ids), embeddings.vectors.shape[1]), embeddings.vectors.dtype
+    )
+    vectors[~oov] = embeddings.vectors[ids[~oov]]
+
+    offsets = np.cumsum(lengths) - lengths
+    nonempty = lengths > 0
+    encodings = np.zeros((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+    if nonempty.any():
+        encodings[nonempty] = np.add.reduceat(vectors, offsets[nonempty], axis=0)
+    encodings /= np.maximum(lengths, 1)[:, None]
+    text_ids = np.repeat(np.arange(len(texts)), lengths)
+    oov_counts = np.bincount(text_ids[oov], minlength=len(texts))
+    return encodings, oov_counts
+
+
+class GloveBackend(Backend):
+    """GloVe word vectors; sentences are the mean of their word vectors."""
+
+    name = "glove"
+
+    def __init__(self, path=GLOVE_300_PATH, vocab=None):
+        self._path = path
+        self._pruned = vocab is not None
+        # Files the vectors are read from: the memory-mapped store when
+        # `load_glove` uses it, the text file otherwise.
+        prefix = embedding_store.store_prefix(path)
+        if not self._pruned and embedding_store.store_exists(prefix):
+            self._files = [
+                prefix + embedding_store.MATRIX_EXT,
+                prefix + embedding_store.VOCAB_EXT,
+            ]
+        else:
+            self._files = [path]
+        self.embeddings = load_glove(path, vocab)
+        self.dim = self.embeddings.vectors.shape[1]
+
+    def fingerprint(self):
+        fingerprint = "+".join(map(encoding_cache.fingerprint, self._files))
+        # A pruned load reads the whole file, while a full load stops at the
+        # `read_lines` limit, so their encodings of rare words differ.
+        return f"{fingerprint}:pruned" if self._pruned else fingerprint
+
+    def encode_words(self, texts):
+        ids = np.array(
+            [self.embeddings.vocab.get(text, -1) for text in texts], dtype=np.int64
+        )
+        # Out of vocabulary words are zero vectors; a pruned vocabulary may
+        # hold no vectors at all.
+        vectors = self.embeddings.vectors
+        encodings = np.zeros((len(texts), self.dim), dtype=vectors.dtype)
+        found = ids >= 0
+        encodings[found] = vectors[ids[found]]
+        return encodings
+
+    def encode_sentences(self, texts):
+        encodings, oov_counts = _glove_sentence_matrix(texts, self.embeddings)
+        log(f"{oov_counts.sum()} out of vocabulary words in {len(texts)} sentences")
+        return encodings
+
+
+class FastTextBackend(Backend):
+    name = "fasttext"
+
+    def __init__(self, path=FASTTEXT_PATH, dim=300):
+        self._path = path
+        self.dim = dim
+        self.model = load_fasttext(path, dim)
+
+    def fingerprint(self):
+        return encoding_cache.fingerprint(self._path)
+
+    def encode_words(self, texts):
+        return np.stack([self.model.get_word_vector(text) for text in texts])
+
+    def encode_sentences(self, texts):
+        return np.stack([self.model.get_sentence_vector(text) for text in texts])
+
+
+class ElmoBackend(Backend):
+    """Sentences are the mean of their first-layer ELMo token vectors."""
+
+    name = "elmo"
+    layers = "layer0-mean"
+    # ELMo layers concatenate a forward and a backward 512-dimension LSTM.
+    dim = 1024
+
+    def __init__(self, path=ELMO_DIR, max_batch_size=64):
+        self._path = path
+        self._batch_size = max_batch_size
+        self.model = load_elmo(path, max_batch_size)
+
+    def fingerprint(self):
+        return encoding_cache.fingerprint(self._path)
+
+    def encode_sentences(self, texts):
+        """Sentences are sorted by token count and sent to the model
+        max_batch_size at a time, so each batch pads to a similar length.
+        Padding positions are masked out of the mean.
+        """
+        from tqdm import tqdm
+
+        # 512 dimnsion embeddings
+        log("-" * 80)
+        tokens = [text.split(" ") for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: len(tokens[i]))
+        embeddings = None
+        for start in tqdm(range(0, len(order), self._batch_size), disable=is_quiet()):
+            batch = order[start : start + self._batch_size]
+            vecs = self.model.get_elmo_vectors([tokens[i] for i in batch], layers="all")
+            tok_embs = vecs[:, 0]
+            lengths = np.array([len(tokens[i]) for i in batch])
+            mask = np.arange(tok_embs.shape[1]) < lengths[:, None]
+            sent_embs = (tok_embs * mask[:, :, None]).sum(axis=1) / lengths[:, None]
+            if embeddings is None:
+                embeddings = np.empty((len(texts), sent_embs.shape[1]), sent_embs.dtype)
+            embeddings[batch] = sent_embs
+
+        return embeddings
+
+
+register_backend("glove", GloveBackend)
+register_backend("fasttext", FastTextBackend)
+register_backend("elmo", ElmoBackend)
@@ -0,0 +1,121 @@
+import collections.abc
+import os
+
+import numpy as np
+
+# A store for the embeddings in `<name>.txt` lives next to it as
+# `<name>.npy` (float32 matrix, one row per word) and `<name>.vocab.txt`
+# (the words, one per line, in row order).
+MATRIX_EXT = ".npy"
+VOCAB_EXT = ".vocab.txt"
+
+
+def read_lines(path_to_txt, limit=500000):
+    """Yield the stripped lines of path_to_txt, at most limit of them (all
+    lines when limit is None).
+    """
+    with open(path_to_txt, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if limit is not None and i >= limit:
+                break
+            yield line.strip()
+
+
+def store_prefix(path_to_txt):
+    """Return the path prefix of the store converted from path_to_txt."""
+    return os.path.splitext(path_to_txt)[0]
+
+
+def store_exists(prefix):
+    return os.path.isfile(prefix + MATRIX_EXT) and os.path.isfile(prefix + VOCAB_EXT)
+
+
+class EmbeddingStore(collections.abc.Mapping):
+    """Read-only mapping from word to vector backed by one contiguous matrix.
+
+    `vectors` holds one row per word and `vocab` maps each word to its row.
+    When the matrix is memory-mapped, rows are only read from disk when they
+    are accessed, and processes that open the same store share its pages
+    through the page cache.
+    """
+
+    def __init__(self, vectors, words):
+        self.vectors = vectors
+        self.vocab = {word: i for i, word in enumerate(words)}
+
+    def __getitem__(self, word):
+        return np.asarray(self.vectors[self.vocab[word]])
+
+    def __iter__(self):
+        return iter(self.vocab)
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def __contains__(self, word):
+        return word in self.vocab
+
+
+def load_embedding_store(prefix):
+    vectors = np.load(prefix + MATRIX_EXT, mmap_mode="r")
+    with open(prefix + VOCAB_EXT, "r", encoding="utf-8") as f:
+        words = f.read().split("\n")[: len(vectors)]
+    return EmbeddingStore(vectors, words)
+
+
+def load_embeddings_subset(path_to_txt, words):
+    """Load the vectors of words from embeddings in the GloVe text format.
+
+    The whole text file is streamed once and only the vectors of words are
+    parsed and kept, so memory grows with the number of words rather than
+    with the size of the file.
+    """
+    words = set(words)
+    kept = {}
+    dim = None
+    for line in read_lines(path_to_txt, limit=None):
+        word, _, values = line.partition(" ")
+        if dim is None:
+            dim = len(values.split(" "))
+        if word in words:
+            kept[word] = np.asarray(values.split(" "), "float32")
+    vectors = np.stack(list(kept.values())) if kept else np.empty((0, dim or 0))
+    return EmbeddingStore(vectors.astype(np.float32, copy=False), list(kept))
+
+
+def convert_embeddings(path_to_txt, prefix=None, limit=500000):
+    """Convert embeddings in the GloVe text format to a store.
+
+    The text file is read twice, once to size the matrix and once to fill
+    it, so the whole embedding table is never held in memory.
+
+    Args:
+        path_to_txt: text file with one word and its vector per line.
+        prefix: path prefix of the store, next to path_to_txt by default.
+        limit: number of lines read, as in `read_lines`.
+
+    Returns:
+        The path prefix of the written store.
+    """
+    prefix = prefix or store_prefix(path_to_txt)
+    n_rows = 0
+    dim = None
+    for line in read_lines(path_to_txt, limit):
+        if dim is None:
+            dim = len(line.split(" ")) - 1
+        n_rows += 1
+
+    vectors = np.lib.format.open_memmap(
+        prefix + MATRIX_EXT + ".tmp", mode="w+", dtype=np.float32, shape=(n_rows, dim)
+    )
+    with open(prefix + VOCAB_EXT + ".tmp", "w", encoding="utf-8") as vocab:
+        for i, line in enumerate(read_lines(path_to_txt, limit)):
+            values = line.split(" ")
+            vectors[i] = np.asarray(values[1:], "float32")
+            vocab.write(values[0] + "\n")
+    vectors.flush()
+    del vectors
+
+    os.replace(prefix + MATRIX_EXT + ".tmp", prefix + MATRIX_EXT)
+    os.replace(prefix + VOCAB_EXT + ".tmp", prefix + VOCAB_EXT)
+    return prefix
@@ -0,0 +1,218 @@
+import contextlib
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows.
+    fcntl = None
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+
+
+def fingerprint(path):
+    """Return a fingerprint of the model file or directory at path, built from
+    the paths, sizes and modification times of the files it contains.
+    """
+    if os.path.isdir(path):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    else:
+        paths = [path]
+    digest = hashlib.sha1()
+    for file_path in paths:
+        stat = os.stat(file_path)
+        digest.update(
+            f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode()
+        )
+    return digest.hexdigest()
+
+
+class EncodingCache:
+    """On-disk cache of text encodings shared across runs.
+
+    Encodings are content addressed: an entry is keyed by the hash of its
+    namespace (backend, model fingerprint, dimension and layer configuration)
+    and of the encoded text. Every batch of new encodings is written as one
+    `.npy` shard, and `index.json` maps each key to a row of a shard. When the
+    shards grow beyond max_bytes, the least recently used shards are evicted.
+
+    Several processes may share a cache_dir: the index is re-read, merged and
+    written under an exclusive lock on `index.lock`, and texts are encoded
+    outside the lock. File locks need `fcntl`, so on platforms without it a
+    cache_dir must only be used by one process at a time.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2**30):
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._shards = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._locked():
+            self._read_index()
+
+    def namespace(self, backend, fingerprint, dim, config=""):
+        """Return a view of the cache for the encodings of one model."""
+        return _Namespace(self, f"{backend}:{fingerprint}:{dim}:{config}")
+
+    def get_or_encode(self, namespace, texts, encode):
+        """Return a matrix whose row i is the encoding of texts[i].
+
+        Args:
+            namespace: namespace string of the model producing the encodings.
+            texts: texts to encode.
+            encode: callable mapping a list of texts to a matrix with one
+                encoding per row, called only for the texts missing from the
+                cache.
+        """
+        if not texts:
+            return encode(texts)
+        keys = [_key(namespace, text) for text in texts]
+        with self._locked():
+            self._read_index()
+            # Rows are copied while locked, before another process can evict
+            # their shards.
+            found = self._lookup(set(keys))
+            self._save_index()
+
+        missing = list(
+            dict.fromkeys(text for text, key in zip(texts, keys) if key not in found)
+        )
+        if missing:
+            missing_keys = [_key(namespace, text) for text in missing]
+            matrix = np.asarray(encode(missing))
+            found.update(zip(missing_keys, matrix))
+            with self._locked():
+                self._read_index()
+                self._add_shard(missing_keys, matrix)
+                self._evict()
+                self._save_index()
+        return np.stack([found[key] for key in keys])
+
+    def _lookup(self, keys):
+        """Return a `dict` mapping the keys cached in readable shards to a
+        copy of their encoding, marking their shards as used.
+        """
+        now = time.time()
+        entries = self._index["entries"]
+        found = {}
+        for key in keys:
+            if key not in entries:
+                continue
+            shard, row = entries[key]
+            matrix = self._load_shard(shard)
+            if matrix is None:
+                continue
+            self._index["shards"][shard]["last_used"] = now
+            found[key] = np.array(matrix[row])
+        return found
+
+    def _add_shard(self, keys, matrix):
+        shard = f"{int(time.time() * 1e6):x}-{os.getpid()}"
+        np.save(os.path.join(self._cache_dir, shard + ".npy"), matrix)
+        self._index["shards"][shard] = {
+            "bytes": matrix.nbytes,
+            "last_used": time.time(),
+        }
+        for row, key in enumerate(keys):
+            self._index["entries"][key] = [shard, row]
+
+    def _load_shard(self, shard):
+        """Return the memory-mapped matrix of shard, or None when its file is
+        gone, in which case its entries are dropped from the index.
+        """
+        if shard not in self._shards:
+            try:
+                self._shards[shard] = np.load(
+                    os.path.join(self._cache_dir, shard + ".npy"), mmap_mode="r"
+                )
+            except FileNotFoundError:
+                self._drop_shards({shard})
+                return None
+        return self._shards[shard]
+
+    def _evict(self):
+        shards = self._index["shards"]
+        # Shards missing from the index, left by a process that died before
+        # saving it, are removed so that max_bytes keeps holding.
+        for name in os.listdir(self._cache_dir):
+            shard, ext = os.path.splitext(name)
+            if ext == ".npy" and shard not in shards:
+                os.remove(os.path.join(self._cache_dir, name))
+
+        total = sum(info["bytes"] for info in shards.values())
+        evicted = set()
+        for shard in sorted(shards, key=lambda s: shards[s]["last_used"]):
+            if total <= self._max_bytes:
+                break
+            total -= shards[shard]["bytes"]
+            evicted.add(shard)
+        if not evicted:
+            return
+
+        for shard in evicted:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self._cache_dir, shard + ".npy"))
+        self._drop_shards(evicted)
+
+    def _drop_shards(self, dropped):
+        for shard in dropped:
+            self._index["shards"].pop(shard, None)
+            self._shards.pop(shard, None)
+        self._index["entries"] = {
+            key: entry
+            for key, entry in self._index["entries"].items()
+            if entry[0] not in dropped
+        }
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the lock of the cache directory in the context."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self._cache_dir, LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        """Load the index as last saved by any process sharing the cache."""
+        index_path = os.path.join(self._cache_dir, INDEX_FILE)
+        if os.path.isfile(index_path):
+            with open(index_path, "r") as f:
+                self._index = json.load(f)
+        else:
+            self._index = {"shards": {}, "entries": {}}
+        # Forget the shards other processes evicted.
+        for shard in set(self._shards) - set(self._index["shards"]):
+            del self._shards[shard]
+
+    def _save_index(self):
+        index_path = os.path.join(self._cache_dir, INDEX_FILE)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(self._index, f)
+        os.replace(index_path + ".tmp", index_path)
+
+
+class _Namespace:
+    def __init__(self, cache, namespace):
+        self._cache = cache
+        self._namespace = namespace
+
+    def get_or_encode(self, texts, encode):
+        return self._cache.get_or_encode(self._namespace, texts, encode)
+
+
+def _key(namespace, text):
+    return hashlib.sha1(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
@@ -0,0 +1,187 @@
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+# Progress messages are printed unless quiet mode is on, see `set_quiet`.
+_quiet = False
+
+
+def set_quiet(quiet=True):
+    """Turn off (or back on) the progress messages printed by `log`."""
+    global _quiet
+    _quiet = quiet
+
+
+def is_quiet():
+    return _quiet
+
+
+def log(*args, **kwargs):
+    """Print a progress message unless quiet mode is on."""
+    if not _quiet:
+        print(*args, **kwargs)
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MiB, or None when
+    the platform does not report it.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    peak = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    return round(peak, 1)
+
+
+def _high_water_mark_mb():
+    """Return the peak resident set size since the last `_reset_high_water_mark`
+    in MiB, or None when /proc does not report it.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 2**10, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _reset_high_water_mark():
+    """Reset the peak resident set size reported by /proc to the current one.
+
+    Returns:
+        Whether the peak could be reset, which needs Linux.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+# Peak RSS in MiB of each phase open in the main thread, innermost last.
+_open_phases = []
+
+
+def _fold_high_water_mark():
+    """Fold the peak RSS since the last reset into the innermost open phase,
+    before the peak is reset or read.
+    """
+    if _open_phases:
+        peak = _high_water_mark_mb()
+        if peak is not None:
+            _open_phases[-1] = max(_open_phases[-1] or 0.0, peak)
+
+
+class Timeline:
+    """Wall time and peak RSS of the phases of a run.
+
+    Every phase is stored as a plain dict, so the events recorded in a worker
+    process can be returned to the parent and merged with `extend`.
+
+    On Linux, the peak RSS of a phase is the peak reached while it ran: the
+    high water mark of the process is reset when a phase starts, after
+    folding it into the phases around it. Elsewhere, and in phases run by
+    other threads, it is the peak of the whole process up to the end of the
+    phase.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    @contextlib.contextmanager
+    def phase(self, name, **args):
+        """Record the code run in the context as a phase called name, with
+        args attached to the event.
+        """
+        ts = time.time()
+        start = time.perf_counter()
+        # The high water mark is shared by the whole process, so only phases
+        # of the main thread reset it.
+        tracked = threading.current_thread() is threading.main_thread()
+        if tracked:
+            _fold_high_water_mark()
+            tracked = _reset_high_water_mark()
+        if tracked:
+            _open_phases.append(_high_water_mark_mb())
+        try:
+            yield
+        finally:
+            if tracked:
+                _fold_high_water_mark()
+                peak = _open_phases.pop()
+                if _open_phases and peak is not None:
+                    _open_phases[-1] = max(_open_phases[-1] or 0.0, peak)
+            else:
+                peak = peak_rss_mb()
+            self.events.append(
+                {
+                    "name": name,
+                    "ts": ts,
+                    "dur": time.perf_counter() - start,
+                    "pid": os.getpid(),
+                    "peak_rss_mb": peak,
+                    "args": args,
+                }
+            )
+
+    def extend(self, events, **args):
+        """Add events recorded by another timeline, with args attached."""
+        for event in events:
+            self.events.append({**event, "args": {**event["args"], **args}})
+
+    def summary(self, **args):
+        """Return the total wall time and the peak RSS of each phase.
+
+        Only the events whose args agree with args are counted; events
+        without one of the args are counted too.
+
+        Returns:
+            `dict` mapping each phase name to a `dict` with "wall_s" and
+            "peak_rss_mb".
+        """
+        phases = {}
+        for event in self.events:
+            if any(
+                event["args"].get(key, value) != value for key, value in args.items()
+            ):
+                continue
+            phase = phases.setdefault(
+                event["name"], {"wall_s": 0.0, "peak_rss_mb": None}
+            )
+            phase["wall_s"] += event["dur"]
+            if event["peak_rss_mb"] is not None:
+                phase["peak_rss_mb"] = max(
+                    phase["peak_rss_mb"] or 0.0, event["peak_rss_mb"]
+                )
+        return phases
+
+    def write_chrome_trace(self, path):
+        """Write the events in the Chrome trace event format, viewable in
+        chrome://tracing or Perfetto.
+        """
+        trace_events = [
+            {
+                "name": event["name"],
+                "ph": "X",
+                "ts": event["ts"] * 1e6,
+                "dur": event["dur"] * 1e6,
+                "pid": event["pid"],
+                "tid": event["pid"],
+                "args": {**event["args"], "peak_rss_mb": event["peak_rss_mb"]},
+            }
+            for event in self.events
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,321 @@
+import concurrent.futures
+import concurrent.futures.process
+import contextlib
+import itertools
+import json
+import os
+
+from seat_bench import backends, results, seat
+from seat_bench.experiment_id import generate_experiment_id
+from seat_bench.instrumentation import log, set_quiet
+
+# Runner of each kind of test.
+RUNNERS = {"weat": seat.WEATRunner, "seat": seat.SEATRunner}
+# Models that only encode sentences, so they have no WEAT results.
+SENTENCE_MODELS = ("elmo",)
+# Relative cost of encoding one text with each model, used to schedule the
+# longest work first.
+MODEL_COSTS = {"glove": 1, "fasttext": 2, "elmo": 1000}
+# Maximum number of workers holding a model at once, unless overridden, for
+# models too large to load on every worker.
+MAX_MODEL_WORKERS = {"elmo": 2}
+
+
+def experiment_paths(persistent_dir, kind, language, mode, embedding_model):
+    """Return the data directory, the results directory and the experiment id
+    of a kind of test ("weat" or "seat") in a language and mode.
+
+    Languages without separate word list modes, such as en, keep their tests
+    in data/<kind>/<language>, which is then used for every mode.
+    """
+    subdir = os.path.join(kind, language, mode)
+    name = f"{kind}_all_{mode}_{embedding_model}"
+    if not os.path.isdir(os.path.join(persistent_dir, "data", subdir)):
+        subdir = os.path.join(kind, language)
+        name = f"{kind}_all_{language}_{embedding_model}"
+    return (
+        os.path.join(persistent_dir, "data", subdir),
+        os.path.join(persistent_dir, "results", subdir),
+        generate_experiment_id(name=name),
+    )
+
+
+def experiment_grid(persistent_dir, kinds, languages, modes, embedding_models):
+    """Return the experiments of a grid, one per data directory and model.
+
+    Combinations without data or whose tests lack the texts of their kind
+    (such as English word lists without SEAT sentences), and WEAT with models
+    that only encode sentences, are skipped.
+
+    Returns:
+        `list` of `dict`s with the kind, language, mode, embedding_model,
+        data_dir, results_dir, experiment_id, tests and the number of
+        distinct texts of the tests ("n_texts") of each experiment.
+    """
+    experiments = {}
+    for kind, language, mode, model in itertools.product(
+        kinds, languages, modes, embedding_models
+    ):
+        if kind == "weat" and model in SENTENCE_MODELS:
+            continue
+        data_dir, results_dir, experiment_id = experiment_paths(
+            persistent_dir, kind, language, mode, model
+        )
+        if not os.path.isdir(data_dir):
+            log(f"Skipping {kind} {language} {mode}: no {data_dir}")
+            continue
+        if (data_dir, model) in experiments:
+            continue
+        tests = sorted(seat._list_tests(data_dir), key=seat._test_sort_key)
+        n_texts = _count_texts(data_dir, tests, RUNNERS[kind]._TEXT_KEY)
+        if n_texts is None:
+            log(f"Skipping {kind} {language} {mode}: no {kind} texts in {data_dir}")
+            continue
+        experiments[data_dir, model] = {
+            "kind": kind,
+            "language": language,
+            "mode": mode,
+            "embedding_model": model,
+            "data_dir": data_dir,
+            "results_dir": results_dir,
+            "experiment_id": experiment_id,
+            "tests": tests,
+            "n_texts": n_texts,
+        }
+    return list(experiments.values())
+
+
+def _count_texts(data_dir, tests, key):
+    """Return the number of distinct texts stored under key in tests, or
+    None when a test has none.
+    """
+    texts = set()
+    for test in tests:
+        with open(os.path.join(data_dir, f"{test}{seat.TEST_EXT}"), "r") as f:
+            encs = json.load(f)
+        if any(key not in encs[category] for category in seat.CATEGORIES):
+            return None
+        texts.update(
+            text for category in seat.CATEGORIES for text in encs[category][key]
+        )
+    return len(texts)
+
+
+def _experiment_cost(experiment):
+    """Return the estimated cost of an experiment: the number of distinct
+    texts it encodes, weighted by the cost of the model.
+    """
+    cost = MODEL_COSTS.get(experiment["embedding_model"], 1)
+    return experiment["n_texts"] * cost
+
+
+# Backend of the model a worker process last ran, kept for its next jobs.
+_worker_backends = {}
+
+
+def _worker_backend(model, elmo_batch_size):
+    """Return the backend of model, loading it only if the worker process
+    does not hold it yet. The previously held model is dropped first.
+    """
+    if model not in _worker_backends:
+        _worker_backends.clear()
+        backends.evict_fasttext()
+        kwargs = {"max_batch_size": elmo_batch_size} if model == "elmo" else {}
+        _worker_backends[model] = backends.load_backend(model, **kwargs)
+    return _worker_backends[model]
+
+
+def _run_job(experiment, resume, elmo_batch_size, options):
+    """Run every test of an experiment in a worker process.
+
+    Results are streamed to the experiment's results log. With resume, the
+    seeds it already holds are skipped.
+    """
+    model = experiment["embedding_model"]
+    runner = RUNNERS[experiment["kind"]](
+        tests=experiment["tests"],
+        data_dir=experiment["data_dir"],
+        experiment_id=experiment["experiment_id"],
+        embedding_model=model,
+        results_path=_results_path(experiment, ".jsonl"),
+        resume=resume,
+        quiet=True,
+        backend=_worker_backend(model, elmo_batch_size),
+        **options,
+    )
+    return runner()
+
+
+def _results_path(experiment, ext):
+    return os.path.join(
+        experiment["results_dir"], f"{experiment['experiment_id']}{ext}"
+    )
+
+
+def _next_model(queues, workers, worker, max_model_workers):
+    """Return the model whose job an idle worker runs next.
+
+    A worker keeps running jobs of the model it holds. Otherwise it takes the
+    model with the most remaining cost per worker holding it, among the
+    models below their limit in max_model_workers.
+    """
+    if queues.get(worker["model"]):
+        return worker["model"]
+    holders = {}
+    for other in workers:
+        if other is not worker and other["model"] is not None:
+            holders[other["model"]] = holders.get(other["model"], 0) + 1
+    candidates = [
+        model
+        for model, queue in queues.items()
+        if queue and holders.get(model, 0) < max_model_workers.get(model, len(workers))
+    ]
+    if not candidates:
+        return None
+    return max(
+        candidates,
+        key=lambda model: sum(cost for cost, _ in queues[model])
+        / (holders.get(model, 0) + 1),
+    )
+
+
+def _worker_executor(stack):
+    """Return a new single-process executor of a worker, shut down on exit
+    of stack.
+    """
+    return stack.enter_context(
+        concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, initializer=set_quiet, initargs=(True,)
+        )
+    )
+
+
+def _replace_executor(stack, worker):
+    """Give a worker whose process died a new executor, which holds no
+    model yet.
+    """
+    worker["executor"].shutdown(wait=False)
+    worker["executor"] = _worker_executor(stack)
+    worker["model"] = None
+
+
+def run_matrix(
+    experiments,
+    n_workers=None,
+    max_model_workers=None,
+    resume=False,
+    overwrite=False,
+    elmo_batch_size=64,
+    **options,
+):
+    """Run every test of experiments on a pool of worker processes.
+
+    Each experiment is a job, so the texts shared by its tests are encoded
+    once. A worker holds one model at a time and loads it once for all the
+    jobs of that model it runs, so long ELMo jobs and short GloVe jobs run
+    side by side on different workers, longest first. The results of an
+    experiment are streamed to its .jsonl log and, once it finished, written
+    to its .json file, as by seat_test.py and weat_test.py.
+
+    Args:
+        experiments: experiments returned by `experiment_grid`.
+        n_workers (int): number of worker processes, all CPUs when None.
+        max_model_workers (dict): maximum number of workers holding a model
+            at once, for models too large to load on every worker, updating
+            the defaults of `MAX_MODEL_WORKERS`.
+        resume (bool): keep the results already logged for each experiment
+            instead of starting over.
+        overwrite (bool): discard the results already logged when not
+            resuming. Without resume or overwrite, no experiment runs if one
+            of their logs holds results.
+        elmo_batch_size (int): maximum number of sentences per ELMo batch.
+        options: other arguments of the runners, such as n_samples and seeds.
+
+    Returns:
+        `dict` mapping the path of each written .json file to its results.
+    """
+    n_workers = n_workers or os.cpu_count()
+    max_model_workers = {**MAX_MODEL_WORKERS, **(max_model_workers or {})}
+
+    if not resume and not overwrite:
+        for experiment in experiments:
+            path = _results_path(experiment, ".jsonl")
+            if results.ResultsLog(path).read():
+                raise ValueError(
+                    f"{path} already holds results; resume to keep them or "
+                    "overwrite to discard them."
+                )
+    options = {**options, "overwrite": overwrite}
+
+    queues = {}
+    for i, experiment in enumerate(experiments):
+        os.makedirs(experiment["results_dir"], exist_ok=True)
+        queue = queues.setdefault(experiment["embedding_model"], [])
+        queue.append((_experiment_cost(experiment), i))
+    # Jobs are popped from the end, most expensive first.
+    for queue in queues.values():
+        queue.sort()
+    n_jobs = len(experiments)
+    log(f"Running {n_jobs} experiments")
+
+    written = {}
+    failed = []
+    with contextlib.ExitStack() as stack:
+        workers = [
+            {"executor": _worker_executor(stack), "model": None}
+            for _ in range(n_workers)
+        ]
+        # Worker and experiment index of each running job.
+        running = {}
+        while True:
+            busy = [worker for worker, _ in running.values()]
+            for worker in workers:
+                if any(worker is other for other in busy):
+                    continue
+                model = _next_model(queues, workers, worker, max_model_workers)
+                if model is None:
+                    continue
+                _, i = queues[model].pop()
+                worker["model"] = model
+                try:
+                    future = worker["executor"].submit(
+                        _run_job, experiments[i], resume, elmo_batch_size, options
+                    )
+                except concurrent.futures.process.BrokenProcessPool as e:
+                    name = experiments[i]["experiment_id"]
+                    log(f"Failed {name}: {e!r}")
+                    failed.append(name)
+                    _replace_executor(stack, worker)
+                    continue
+                running[future] = (worker, i)
+            if not running:
+                break
+
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                worker, i = running.pop(future)
+                experiment = experiments[i]
+                name = experiment["experiment_id"]
+                if future.exception() is not None:
+                    log(f"Failed {name}: {future.exception()!r}")
+                    failed.append(name)
+                    # A worker process that died, e.g. killed when out of
+                    # memory, leaves its executor unusable.
+                    if isinstance(
+                        future.exception(), concurrent.futures.process.BrokenProcessPool
+                    ):
+                        _replace_executor(stack, worker)
+                    continue
+                n_jobs -= 1
+                log(f"Finished {name} ({n_jobs} left)")
+                path = _results_path(experiment, ".json")
+                written[path] = future.result()
+                with open(path, "w") as f:
+                    json.dump(written[path], f, indent=4)
+                log(f"Wrote {path}")
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} experiments failed: {failed}")
+    return written
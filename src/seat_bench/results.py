@@ -0,0 +1,63 @@
+import json
+import os
+import threading
+
+
+class ResultsLog:
+    """Append-only JSON Lines file of test results.
+
+    Every record is flushed and fsynced as soon as it is appended, so an
+    interrupted run keeps the results of all the tests it finished.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        # Terminate a line left incomplete by an interrupted write, so the
+        # next record starts on its own line; `read` skips the partial one.
+        if os.path.isfile(path) and os.path.getsize(path):
+            with open(path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def read(self):
+        """Return the records in the file, skipping incomplete lines."""
+        if not os.path.isfile(self._path):
+            return []
+        records = []
+        with open(self._path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+    def clear(self):
+        with self._lock:
+            open(self._path, "w").close()
+
+    def append(self, record):
+        with self._lock:
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def completed_results(records, experiment_id, seed, config):
+    """Return the results in records of the run identified by experiment_id,
+    seed and config, keyed by test.
+    """
+    completed = {}
+    for record in records:
+        if (
+            record.get("experiment_id") == experiment_id
+            and record.get("seed") == seed
+            and record.get("config") == config
+        ):
+            result = dict(record)
+            del result["config"]
+            completed[result["test"]] = result
+    return completed
@@ -1,28 +1,29 @@
 # Refers : https://github.com/McGill-NLP/bias-bench
 
+import concurrent.futures
+import contextlib
 import json
-import logging
 import os
-import random
 import re
+import zlib
 
 import numpy as np
-from seat_bench import weat
-from tqdm import tqdm
-import fasttext.util
+from seat_bench import backends, encoding_cache, results, test_suite, weat
+from seat_bench.instrumentation import Timeline, is_quiet, log, set_quiet
 
-fasttext.util.download_model("hi", if_exists="ignore")
+# Extension for files containing WEAT and SEAT tests.
+TEST_EXT = ".jsonl"
+# Target and attribute categories of a test.
+CATEGORIES = ("targ1", "targ2", "attr1", "attr2")
 
-ELMO_DIR = "elmo_models/hi"
-DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-GLOVE_50_PATH = os.path.join(DIRECTORY, "glove_models/hi/50/glove", "hi-d50-glove.txt")
-GLOVE_300_PATH = os.path.join(
-    DIRECTORY, "glove_models/hi/300/glove", "hi-d300-glove.txt"
-)
 
+class _TestRunner:
+    """Test loop shared by `WEATRunner` and `SEATRunner`."""
 
-class WEATRunner:
-    """Runs WEAT tests for a given FastText or Glove model."""
+    # Key of the texts encoded in each category of a test.
+    _TEXT_KEY = None
+    # Layer configuration of the encodings in the encoding cache.
+    _CACHE_CONFIG = None
 
     def __init__(
         self,
@@ -32,232 +33,379 @@ class WEATRunner:
         n_samples=1000,
         parametric=False,
         seed=0,
+        seeds=None,
         embedding_model="glove",
+        n_jobs=1,
+        cache_dir=None,
+        cache_max_bytes=2**30,
+        results_path=None,
+        resume=False,
+        overwrite=False,
+        adaptive=False,
+        alpha=0.05,
+        n_bootstrap=1000,
+        bootstrap="targets",
+        centroid=False,
+        quiet=False,
+        prune_vocab=False,
+        suite_path=None,
+        backend=None,
+        max_exact_partitions=None,
     ):
-
         self._tests = tests
         self._data_dir = data_dir
         self._experiment_id = experiment_id
         self._n_samples = n_samples
+        self._max_exact_partitions = max_exact_partitions
         self._parametric = parametric
-        self._seed = seed
+        # Seeds of a sweep reusing each test's encodings and similarities.
+        self._seeds = list(seeds) if seeds else [seed]
         self._embedding_model = embedding_model
-        if self._embedding_model == "glove":
-            # self.hindi_glove_50 = emb_matrix_maker(GLOVE_50_PATH)
-            self.hindi_glove_300 = emb_matrix_maker(GLOVE_300_PATH)
+        self._n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self._results_path = results_path
+        self._results_log = results.ResultsLog(results_path) if results_path else None
+        self._resume = resume
+        self._overwrite = overwrite
+        self._adaptive = adaptive
+        self._alpha = alpha
+        self._n_bootstrap = n_bootstrap
+        self._bootstrap = bootstrap
+        self._centroid = centroid
+        self._load_timings = {}
+        self._prune_vocab = prune_vocab
+        set_quiet(quiet)
+        self.timeline = Timeline()
+        self._suite = None
+        if suite_path is not None:
+            with self.timeline.phase("load_suite"):
+                self._suite = test_suite.load_suite(suite_path)
+        if backend is not None:
+            # A backend already loaded for embedding_model, reused as is.
+            self.backend = backend
+        else:
+            with self.timeline.phase("load_model"):
+                self.backend = backends.load_backend(
+                    self._embedding_model, **self._backend_kwargs()
+                )
+        self._cache = _encoding_cache(
+            cache_dir, cache_max_bytes, self.backend, config=self._CACHE_CONFIG
+        )
+        # Timings of the phases shared by all tests, such as load_model.
+        self._setup_timings = self.timeline.summary()
 
     def __call__(self):
-        """Runs specified WEAT tests.
+        """Runs specified tests.
 
         Returns:
-            `list` of `dict`s containing the WEAT test results.
+            `list` of `dict`s containing the test results.
         """
-        # Extension for files containing WEAT tests.
-        TEST_EXT = ".jsonl"
-
-        random.seed(self._seed)
-        np.random.seed(self._seed)
-
-        all_tests = sorted(
-            [
-                entry[: -len(TEST_EXT)]
-                for entry in os.listdir(self._data_dir)
-                if not entry.startswith(".") and entry.endswith(TEST_EXT)
-            ],
-            key=_test_sort_key,
-        )
+        tests = self._selected_tests()
+
+        # Skip the (seed, test) runs a previous run of this configuration
+        # completed.
+        completed = {}
+        if self._results_log is not None:
+            config = self._config()
+            if self._resume:
+                records = self._results_log.read()
+                for seed in self._seeds:
+                    for test, result in results.completed_results(
+                        records, self._experiment_id, seed, config
+                    ).items():
+                        completed[seed, test] = result
+                log(f"Resuming: {len(completed)} test runs already completed")
+            elif self._results_log.read():
+                # The log may hold the finished tests of a crashed run.
+                if not self._overwrite:
+                    raise ValueError(
+                        f"{self._results_path} already holds results; resume "
+                        "to keep them or overwrite to discard them."
+                    )
+                self._results_log.clear()
+        pending = {}
+        for test in tests:
+            seeds = [seed for seed in self._seeds if (seed, test) not in completed]
+            if seeds:
+                pending[test] = seeds
+        if pending:
+            self._run(pending, completed)
+
+        log("Phase timings:")
+        for name, phase in self.timeline.summary().items():
+            log(
+                f"\t{name}: {phase['wall_s']:.2f}s, peak RSS {phase['peak_rss_mb']} MiB"
+            )
 
-        # Use the specified tests, otherwise, run all WEAT tests.
-        tests = self._tests or all_tests
+        return [completed[seed, test] for test in tests for seed in self._seeds]
 
-        results = []
-        for test in tests:
-            print(f"Running test {test}")
-
-            # Load the test data.
-            encs = _load_json(os.path.join(self._data_dir, f"{test}{TEST_EXT}"))
-
-            if self._embedding_model == "fasttext":
-                print("Computing FastText word encodings")
-                encs_targ1 = _fasttext_encode(encs["targ1"]["examples"])
-                encs_targ2 = _fasttext_encode(encs["targ2"]["examples"])
-                encs_attr1 = _fasttext_encode(encs["attr1"]["examples"])
-                encs_attr2 = _fasttext_encode(encs["attr2"]["examples"])
-
-            elif self._embedding_model == "glove":
-                print("Computing Glove word encodings")
-                encs_targ1 = _glove_encode(
-                    encs["targ1"]["examples"], model=self.hindi_glove_300
-                )
-                encs_targ2 = _glove_encode(
-                    encs["targ2"]["examples"], model=self.hindi_glove_300
-                )
-                encs_attr1 = _glove_encode(
-                    encs["attr1"]["examples"], model=self.hindi_glove_300
+    def _run(self, pending, completed):
+        """Runs every test in pending for its `list` of seeds, adding the
+        results to completed.
+        """
+        # Encode each test's texts and submit it right away, so the results of
+        # the first tests are recorded while later ones are still encoding.
+        # Texts shared with earlier tests are encoded only once.
+        vectors = {}
+        runs = {}
+        with _test_executor(self._n_jobs) as executor:
+            for test, seeds in pending.items():
+                prepare = Timeline()
+                with prepare.phase("load_json"):
+                    encs = self._load_test(test)
+                texts = self._test_texts(test, encs)
+                new = [text for text in texts if text not in vectors]
+                log(f"Encoding {len(new)} new of {len(texts)} distinct texts")
+                if new:
+                    with prepare.phase("encode"):
+                        vectors.update(zip(new, self._encode(new)))
+                self._load_timings[test] = prepare.summary()
+                self.timeline.extend(prepare.events, test=test)
+
+                run = self._submit_test(executor, test, seeds, encs, vectors)
+                run.add_done_callback(
+                    lambda run, test=test, seeds=seeds: self._record(test, seeds, run)
                 )
-                encs_attr2 = _glove_encode(
-                    encs["attr2"]["examples"], model=self.hindi_glove_300
+                runs[test] = run
+
+            for test, run in runs.items():
+                outcomes = run.result()
+                # The events of the test's phases are shared by its seeds.
+                self.timeline.extend(outcomes[0][2]["trace"], test=test)
+                for seed, outcome in zip(pending[test], outcomes):
+                    completed[seed, test] = self._result(test, seed, *outcome)
+
+    def _test_texts(self, test, encs):
+        """Returns the distinct texts of a test, in the order they appear."""
+        if self._suite is not None:
+            return self._suite.unique_texts([test], self._TEXT_KEY, CATEGORIES)
+        return _unique_texts([encs], self._TEXT_KEY)
+
+    def _selected_tests(self):
+        """Returns the names of the tests to run, in test order."""
+        if self._suite is not None:
+            all_tests = self._suite.tests
+        else:
+            all_tests = _list_tests(self._data_dir)
+
+        # Use the specified tests, otherwise, run all tests.
+        return sorted(self._tests or all_tests, key=_test_sort_key)
+
+    def _load_test(self, test):
+        """Loads a test from the compiled suite, or else from its file."""
+        if self._suite is not None:
+            return self._suite.load_test(test)
+        return _load_json(os.path.join(self._data_dir, f"{test}{TEST_EXT}"))
+
+    def _backend_kwargs(self):
+        """Returns the arguments loading only the embeddings of the words in
+        the selected tests, when pruning is on and the model is GloVe.
+        """
+        if self._prune_vocab and self._embedding_model == "glove":
+            return {
+                "vocab": _test_vocabulary(
+                    map(self._load_test, self._selected_tests()), self._TEXT_KEY
                 )
-            else:
-                raise NotImplementedError("Embedding model not implemented.")
+            }
+        return {}
 
-            encs["targ1"]["encs"] = encs_targ1
-            encs["targ2"]["encs"] = encs_targ2
-            encs["attr1"]["encs"] = encs_attr1
-            encs["attr2"]["encs"] = encs_attr2
+    def write_trace(self, path):
+        """Writes the phases of the runs so far as a Chrome trace."""
+        self.timeline.write_chrome_trace(path)
 
-            print("\tDone!")
+    def _config(self):
+        """Returns the settings a resumed run must share with the results it
+        reuses.
+        """
+        return {
+            "data_dir": os.path.basename(os.path.normpath(self._data_dir)),
+            "embedding_model": self._embedding_model,
+            "n_samples": self._n_samples,
+            "max_exact_partitions": self._max_exact_partitions,
+            "parametric": self._parametric,
+            "adaptive": self._adaptive,
+            "alpha": self._alpha,
+            "n_bootstrap": self._n_bootstrap,
+            "bootstrap": self._bootstrap,
+            "centroid": self._centroid,
+            "prune_vocab": self._prune_vocab,
+        }
+
+    def _result(self, test, seed, esize, pval, report):
+        result = {
+            "experiment_id": self._experiment_id,
+            "seed": seed,
+            "embedding_model": self._embedding_model,
+            "test": test,
+            "p_value": pval,
+            "effect_size": esize,
+        }
+        if "effect_size_ci" in report:
+            result["effect_size_ci"] = report["effect_size_ci"]
+        # Report the precision of the p-value when sampling stops early.
+        if self._adaptive:
+            for key in ("n_permutations", "p_value_ci", "stopped_by"):
+                if key in report:
+                    result[key] = report[key]
+        # Wall time and peak RSS of the runner's and the test's phases.
+        result["timings"] = {
+            **self._setup_timings,
+            **self._load_timings.get(test, {}),
+            **report["timings"],
+        }
+        return result
+
+    def _record(self, test, seeds, run):
+        """Appends the results of a finished test to the results log."""
+        if self._results_log is None or run.exception() is not None:
+            return
+        for seed, outcome in zip(seeds, run.result()):
+            record = self._result(test, seed, *outcome)
+            record["config"] = self._config()
+            self._results_log.append(record)
+
+    def _encode(self, texts):
+        """Encodes texts with the runner's embedding backend.
 
-            # Run the test on the encodings.
-            esize, pval = weat.run_test(
-                encs,
-                n_samples=self._n_samples,
-                parametric=self._parametric,
-            )
+        Returns:
+            The matrix of encodings, one row per text.
+        """
+        log(f"Computing {self._embedding_model} {self._TEXT_KEY} encodings")
+        encode = (
+            self.backend.encode_words
+            if self._TEXT_KEY == "examples"
+            else self.backend.encode_sentences
+        )
+        if self._cache is not None:
+            encodings = self._cache.get_or_encode(texts, encode)
+        else:
+            encodings = encode(texts)
+        log("\tDone!")
+        return encodings
+
+    def _submit_test(self, executor, test, seeds, encs, vectors):
+        """Attaches the encodings in vectors, a `dict` mapping texts to their
+        encoding, to a test and submits its WEAT for every seed in seeds to
+        executor.
 
-            results.append(
-                {
-                    "experiment_id": self._experiment_id,
-                    "seed": self._seed,
-                    "embedding_model": self._embedding_model,
-                    "test": test,
-                    "p_value": pval,
-                    "effect_size": esize,
-                }
-            )
+        Returns:
+            `concurrent.futures.Future` of the `list` of (effect size,
+            p-value, report) triples returned by `weat.run_test_seeds`.
+        """
+        log(f"Running test {test}")
+        for category in CATEGORIES:
+            texts = dict.fromkeys(encs[category][self._TEXT_KEY])
+            encs[category]["encs"] = np.stack([vectors[text] for text in texts])
+
+        # Run the test on the encodings.
+        return _submit(
+            executor,
+            weat.run_test_seeds,
+            encs,
+            n_samples=self._n_samples,
+            rngs=[_test_rng(seed, test) for seed in seeds],
+            parametric=self._parametric,
+            max_exact_partitions=self._max_exact_partitions,
+            adaptive=self._adaptive,
+            alpha=self._alpha,
+            n_bootstrap=self._n_bootstrap,
+            bootstrap=self._bootstrap,
+            centroid=self._centroid,
+        )
+
+
+class WEATRunner(_TestRunner):
+    """Runs WEAT tests for a given FastText or Glove model."""
 
-        return results
+    _TEXT_KEY = "examples"
+    _CACHE_CONFIG = "words"
 
 
-class SEATRunner:
+class SEATRunner(_TestRunner):
     """Runs SEAT tests for a given FastText or Glove model or ELMO."""
 
-    def __init__(
-        self,
-        tests,
-        data_dir,
-        experiment_id,
-        n_samples=1000,
-        parametric=False,
-        seed=0,
-        embedding_model="glove",
-    ):
+    _TEXT_KEY = "sentences"
+    _CACHE_CONFIG = "sentences"
+
+    def __init__(self, *args, elmo_batch_size=64, **kwargs):
         """Initializes a SEAT test runner."""
+        self._elmo_batch_size = elmo_batch_size
+        super().__init__(*args, **kwargs)
 
-        self._tests = tests
-        self._data_dir = data_dir
-        self._experiment_id = experiment_id
-        self._n_samples = n_samples
-        self._parametric = parametric
-        self._seed = seed
-        self._embedding_model = embedding_model
-        if self._embedding_model == "glove":
-            # self.hindi_glove_50 = emb_matrix_maker(GLOVE_50_PATH)
-            self.hindi_glove_300 = emb_matrix_maker(GLOVE_300_PATH)
+    def _backend_kwargs(self):
         if self._embedding_model == "elmo":
-            from simple_elmo import ElmoModel
+            return {"max_batch_size": self._elmo_batch_size}
+        return super()._backend_kwargs()
 
-            logging.getLogger("simple_elmo").setLevel(logging.ERROR)
-            self.model = ElmoModel()
-            self.model.load(ELMO_DIR)
 
-    def __call__(self):
-        """Runs specified SEAT tests.
+def _list_tests(data_dir):
+    """Return the names of the tests in data_dir."""
+    return [
+        entry[: -len(TEST_EXT)]
+        for entry in os.listdir(data_dir)
+        if not entry.startswith(".") and entry.endswith(TEST_EXT)
+    ]
 
-        Returns:
-            `list` of `dict`s containing the SEAT test results.
-        """
-        # Extension for files containing WEAT tests.
-        TEST_EXT = ".jsonl"
-
-        random.seed(self._seed)
-        np.random.seed(self._seed)
-
-        all_tests = sorted(
-            [
-                entry[: -len(TEST_EXT)]
-                for entry in os.listdir(self._data_dir)
-                if not entry.startswith(".") and entry.endswith(TEST_EXT)
-            ],
-            key=_test_sort_key,
-        )
 
-        # Use the specified tests, otherwise, run all SEAT tests.
-        tests = self._tests or all_tests
+def _test_vocabulary(tests, key):
+    """Return the words tests need embeddings for: the texts stored under key
+    in their categories and the tokens of those texts.
+    """
+    vocab = set()
+    for encs in tests:
+        for category in CATEGORIES:
+            for text in encs[category][key]:
+                vocab.add(text)
+                vocab.update(text.split())
+    log(f"Selected tests use {len(vocab)} words")
+    return vocab
+
+
+def _unique_texts(tests, key):
+    """Return the texts stored under key in the categories of tests, without
+    duplicates and in the order they first appear.
+    """
+    texts = [
+        text
+        for encs in tests
+        for category in CATEGORIES
+        for text in encs[category][key]
+    ]
+    return list(dict.fromkeys(texts))
 
-        results = []
-        for test in tests:
-            print(f"Running test {test}")
-
-            # Load the test data.
-            encs = _load_json(os.path.join(self._data_dir, f"{test}{TEST_EXT}"))
-
-            if self._embedding_model == "fasttext":
-                print("Computing FastText sentence encodings")
-                encs_targ1 = _fasttext_sentence_encode(encs["targ1"]["sentences"])
-                encs_targ2 = _fasttext_sentence_encode(encs["targ2"]["sentences"])
-                encs_attr1 = _fasttext_sentence_encode(encs["attr1"]["sentences"])
-                encs_attr2 = _fasttext_sentence_encode(encs["attr2"]["sentences"])
-
-            elif self._embedding_model == "elmo":
-                print("Computing ELMO sentence encodings")
-                encs_targ1 = _elmo_sentence_encode(
-                    encs["targ1"]["sentences"], self.model
-                )
-                encs_targ2 = _elmo_sentence_encode(
-                    encs["targ2"]["sentences"], self.model
-                )
-                encs_attr1 = _elmo_sentence_encode(
-                    encs["attr1"]["sentences"], self.model
-                )
-                encs_attr2 = _elmo_sentence_encode(
-                    encs["attr2"]["sentences"], self.model
-                )
 
-            elif self._embedding_model == "glove":
-                print("Computing Glove sentence encodings")
-                encs_targ1 = _glove_sentence_encode(
-                    encs["targ1"]["sentences"], model=self.hindi_glove_300
-                )
-                encs_targ2 = _glove_sentence_encode(
-                    encs["targ2"]["sentences"], model=self.hindi_glove_300
-                )
-                encs_attr1 = _glove_sentence_encode(
-                    encs["attr1"]["sentences"], model=self.hindi_glove_300
-                )
-                encs_attr2 = _glove_sentence_encode(
-                    encs["attr2"]["sentences"], model=self.hindi_glove_300
-                )
+def _test_rng(seed, test):
+    """Return the random generator used for the permutation test of test.
 
-            else:
-                raise NotImplementedError("Embedding model not implemented.")
+    The stream is derived from the run seed and the test name only, so a
+    test's result does not depend on which tests run before it or on how the
+    tests are scheduled.
+    """
+    seed_seq = np.random.SeedSequence(seed, spawn_key=(zlib.crc32(test.encode()),))
+    return np.random.default_rng(seed_seq)
 
-            encs["targ1"]["encs"] = encs_targ1
-            encs["targ2"]["encs"] = encs_targ2
-            encs["attr1"]["encs"] = encs_attr1
-            encs["attr2"]["encs"] = encs_attr2
 
-            print("\tDone!")
+def _test_executor(n_jobs):
+    """Return a process pool running n_jobs tests at a time, or a null context
+    yielding None when tests run in this process.
+    """
+    if n_jobs > 1:
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=n_jobs, initializer=set_quiet, initargs=(is_quiet(),)
+        )
+    return contextlib.nullcontext()
 
-            # Run the test on the encodings.
-            esize, pval = weat.run_test(
-                encs,
-                n_samples=self._n_samples,
-                parametric=self._parametric,
-            )
 
-            results.append(
-                {
-                    "experiment_id": self._experiment_id,
-                    "seed": self._seed,
-                    "embedding_model": self._embedding_model,
-                    "test": test,
-                    "p_value": pval,
-                    "effect_size": esize,
-                }
-            )
+def _submit(executor, fn, *args, **kwargs):
+    """Submit fn to executor, or call it right away when executor is None.
 
-        return results
+    Returns:
+        `concurrent.futures.Future` holding the result of fn.
+    """
+    if executor is not None:
+        return executor.submit(fn, *args, **kwargs)
+    future = concurrent.futures.Future()
+    future.set_result(fn(*args, **kwargs))
+    return future
 
 
 def _test_sort_key(test):
@@ -277,7 +425,7 @@ def _test_sort_key(test):
 
 def _load_json(sent_file):
     """Load from json. We expect a certain format later, so do some post processing."""
-    print(f"Loading {sent_file}...")
+    log(f"Loading {sent_file}...")
     all_data = json.load(open(sent_file, "r"))
     data = {}
     for k, v in all_data.items():
@@ -288,68 +436,13 @@ def _load_json(sent_file):
     return all_data
 
 
-def read_lines(path_to_txt, limit=500000):
-    with open(path_to_txt, "r", encoding="utf-8") as f:
-        for i, line in enumerate(f):
-            if i >= limit:
-                break
-            yield line.strip()
-
-
-def emb_matrix_maker(path_to_txt):
-    embeddings = {}
-    for line in tqdm(read_lines(path_to_txt)):
-        values = line.split(" ")
-        word = values[0]
-        vector = np.asarray(values[1:], "float32")
-        embeddings[word] = vector
-    return embeddings
-
-
-def _glove_encode(texts, dim=300, model=None):
-    embeddings = model
-    return {
-        text: embeddings.get(text, np.zeros_like(embeddings[next(iter(embeddings))]))
-        for text in texts
-    }
-
-
-def _glove_sentence_encode(texts, dim=300, model=None):
-    embeddings = model
-    result = {}
-    for text in texts:
-        words = text.split()
-        vectors = [
-            embeddings.get(word, np.zeros_like(embeddings[next(iter(embeddings))]))
-            for word in words
-        ]
-        result[text] = np.mean(vectors, axis=0)
-    return result
-
-
-def _fasttext_encode(texts, dim=300):
-    fasttext_emb = fasttext.load_model("cc.hi.300.bin")
-    if dim != 300:
-        fasttext_emb = fasttext.util.reduce_model(fasttext_emb, dim)
-    return {text: fasttext_emb.get_word_vector(text) for text in texts}
-
-
-def _fasttext_sentence_encode(texts, dim=300):
-    fasttext_emb = fasttext.load_model("cc.hi.300.bin")
-    if dim != 300:
-        fasttext_emb = fasttext.util.reduce_model(fasttext_emb, dim)
-    return {text: fasttext_emb.get_sentence_vector(text) for text in texts}
-
-
-def _elmo_sentence_encode(texts, model):
-    # 512 dimnsion embeddings
-    print("-" * 80)
-    embeddings = []
-    for text in tqdm(texts):
-        tokens = text.split(" ")
-        vecs = model.get_elmo_vectors([tokens], layers="all")
-        tok_embs = vecs[0][0]
-        sent_emb = np.mean(tok_embs, axis=0)
-        embeddings.append(sent_emb)
-
-    return dict(zip(texts, embeddings))
+def _encoding_cache(cache_dir, max_bytes, backend, config):
+    """Return the view of the encoding cache in cache_dir holding encodings of
+    backend, or None when caching is disabled.
+    """
+    if cache_dir is None:
+        return None
+    cache = encoding_cache.EncodingCache(cache_dir, max_bytes)
+    return cache.namespace(
+        backend.name, backend.fingerprint(), backend.dim, f"{config}{backend.layers}"
+    )
@@ -0,0 +1,221 @@
+import concurrent.futures
+import http.server
+import json
+import math
+import queue
+import threading
+import time
+
+import numpy as np
+from seat_bench import weat
+from seat_bench.instrumentation import is_quiet, log
+from seat_bench.seat import CATEGORIES
+
+# Key of the texts of a category for each kind of test.
+TEXT_KEYS = {"weat": "examples", "seat": "sentences"}
+
+
+class EncodeBatcher:
+    """Encodes the texts of concurrent requests with shared backend calls.
+
+    Requests are queued, and a worker thread collects all requests arriving
+    within window seconds of the first one, encodes their distinct texts with
+    one call per kind of text, and hands each request its rows.
+    """
+
+    def __init__(self, backend, window=0.005):
+        self._backend = backend
+        self._window = window
+        self._queue = queue.Queue()
+        # Number of backend calls made, for monitoring.
+        self.n_calls = 0
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def encode(self, texts, key):
+        """Return the matrix of encodings of texts, which are words when key
+        is "examples" and sentences when key is "sentences".
+        """
+        future = concurrent.futures.Future()
+        self._queue.put((texts, key, future))
+        return future.result()
+
+    def _serve(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._window
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            for key in TEXT_KEYS.values():
+                requests = [request for request in batch if request[1] == key]
+                if requests:
+                    self._encode_batch(requests, key)
+
+    def _encode_batch(self, requests, key):
+        texts = list(dict.fromkeys(text for texts, _, _ in requests for text in texts))
+        encode = (
+            self._backend.encode_words
+            if key == "examples"
+            else self._backend.encode_sentences
+        )
+        try:
+            encodings = encode(texts)
+        except Exception as e:
+            for _, _, future in requests:
+                future.set_exception(e)
+            return
+        self.n_calls += 1
+        rows = {text: i for i, text in enumerate(texts)}
+        for texts, _, future in requests:
+            future.set_result(encodings[[rows[text] for text in texts]])
+
+
+def _parse_query(query):
+    """Return the kind of test and the categories of a query.
+
+    Each of targ1, targ2, attr1 and attr2 is either a list of texts or a
+    category of a test file, a dict with a "category" name and its texts.
+    """
+    kind = query.get("kind", "weat")
+    if kind not in TEXT_KEYS:
+        raise ValueError(f"kind must be one of {sorted(TEXT_KEYS)}.")
+    categories = {}
+    for category in CATEGORIES:
+        value = query.get(category)
+        if isinstance(value, dict):
+            name, texts = value.get("category", category), value.get(TEXT_KEYS[kind])
+        else:
+            name, texts = category, value
+        if not isinstance(texts, list) or not texts:
+            raise ValueError(f"{category} must have a non-empty list of texts.")
+        if not all(isinstance(text, str) for text in texts):
+            raise ValueError(f"The texts of {category} must be strings.")
+        # Repeated texts count once, as in the test runners.
+        categories[category] = (name, list(dict.fromkeys(texts)))
+    if len(categories["targ1"][1]) != len(categories["targ2"][1]):
+        raise ValueError("targ1 and targ2 must have the same number of texts.")
+    return kind, categories
+
+
+class BiasServer(http.server.ThreadingHTTPServer):
+    """HTTP server answering WEAT and SEAT queries with a loaded backend.
+
+    A query is POSTed to /query as a JSON object with targ1, targ2, attr1
+    and attr2 (see `_parse_query`), optionally kind ("weat" or "seat"),
+    n_samples, max_exact_partitions, seed, parametric, adaptive, alpha,
+    n_bootstrap and centroid.
+    The reply holds the effect size, the p-value and the report of
+    `weat.run_test`. Concurrent queries share their encode calls through an
+    `EncodeBatcher`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, backend, batch_window=0.005):
+        super().__init__(address, _QueryHandler)
+        self.backend = backend
+        self.batcher = EncodeBatcher(backend, batch_window)
+
+    def run_query(self, query):
+        kind, categories = _parse_query(query)
+        key = TEXT_KEYS[kind]
+        texts = [text for _, texts in categories.values() for text in texts]
+        encodings = self.batcher.encode(texts, key)
+
+        encs = {}
+        start = 0
+        for category, (name, texts) in categories.items():
+            encs[category] = {
+                "category": name,
+                "encs": encodings[start : start + len(texts)],
+            }
+            start += len(texts)
+
+        esize, pval, report = weat.run_test(
+            encs,
+            n_samples=int(query.get("n_samples", 1000)),
+            max_exact_partitions=int(query.get("max_exact_partitions") or 0),
+            parametric=bool(query.get("parametric", False)),
+            rng=np.random.default_rng(int(query.get("seed", 0))),
+            adaptive=bool(query.get("adaptive", False)),
+            alpha=float(query.get("alpha", 0.05)),
+            n_bootstrap=int(query.get("n_bootstrap", 0)),
+            centroid=bool(query.get("centroid", False)),
+            return_report=True,
+        )
+        del report["trace"]
+        return {"p_value": pval, "effect_size": esize, **report}
+
+
+class _QueryHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/health":
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        self._reply(
+            200,
+            {"embedding_model": self.server.backend.name, "status": "ok"},
+        )
+
+    def do_POST(self):
+        if self.path != "/query":
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            query = json.loads(self.rfile.read(length))
+            if not isinstance(query, dict):
+                raise ValueError("The query must be a JSON object.")
+            result = self.server.run_query(query)
+        except (ValueError, TypeError) as e:
+            self._reply(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._reply(200, result)
+
+    def _reply(self, status, body):
+        data = json.dumps(_finite(body), ensure_ascii=False, allow_nan=False).encode(
+            "utf-8"
+        )
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not is_quiet():
+            super().log_message(format, *args)
+
+
+def _finite(value):
+    """Return value with numpy scalars made plain and non-finite floats, such
+    as the NaN effect size of targets that all score the same, made None so
+    the reply is strict JSON.
+    """
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def serve(backend, host="127.0.0.1", port=8000, batch_window=0.005):
+    """Serve queries with backend until interrupted."""
+    with BiasServer((host, port), backend, batch_window) as server:
+        log(f"Serving {backend.name} on http://{host}:{server.server_port}/query")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
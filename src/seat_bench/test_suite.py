@@ -0,0 +1,143 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+# Extension of a test suite compiled from the tests in `<data_dir>`, stored
+# next to it as `<data_dir>.suite`.
+SUITE_EXT = ".suite"
+# A suite file starts with MAGIC and the byte length of a JSON header,
+# followed by the int32 string ids of all texts and the NUL-separated UTF-8
+# strings they refer to.
+MAGIC = b"SEATSUITE1"
+_LENGTH = struct.Struct("<Q")
+
+
+def suite_path(data_dir):
+    """Return the default path of the suite compiled from data_dir."""
+    return os.path.normpath(data_dir) + SUITE_EXT
+
+
+class TestSuite:
+    """Tests of a data directory loaded from one compiled file.
+
+    Every text is interned: it is stored once and referred to by its integer
+    id, and each list of texts of a test category is a slice of one id
+    array.
+    """
+
+    def __init__(self, header, ids, strings):
+        self._header = header
+        self.ids = ids
+        self.strings = strings
+
+    @property
+    def tests(self):
+        """Names of the tests in the suite."""
+        return list(self._header["tests"])
+
+    def __contains__(self, test):
+        return test in self._header["tests"]
+
+    def text_ids(self, test, category, key):
+        """Return the ids of the texts stored under key in a category."""
+        start, stop = self._header["tests"][test][category]["fields"][key]
+        return self.ids[start:stop]
+
+    def load_test(self, test):
+        """Return a test as loaded from its JSON file."""
+        encs = {}
+        for category, index in self._header["tests"][test].items():
+            encs[category] = {}
+            for key, value in index["fields"].items():
+                if key in index["texts"]:
+                    start, stop = value
+                    value = [self.strings[i] for i in self.ids[start:stop]]
+                encs[category][key] = value
+        return encs
+
+    def unique_texts(self, tests, key, categories):
+        """Return the texts stored under key in the categories of tests,
+        without duplicates and in the order they first appear.
+        """
+        ids = np.concatenate(
+            [
+                self.text_ids(test, category, key)
+                for test in tests
+                for category in categories
+            ]
+        )
+        unique, first = np.unique(ids, return_index=True)
+        return [self.strings[i] for i in unique[np.argsort(first)]]
+
+
+def compile_suite(data_dir, test_ext, path=None):
+    """Compile the tests in data_dir into one suite file.
+
+    Args:
+        data_dir: directory of the tests, one JSON file per test.
+        test_ext: extension of the test files.
+        path: path of the suite, `suite_path(data_dir)` by default.
+
+    Returns:
+        The path of the written suite.
+    """
+    path = path or suite_path(data_dir)
+    tests = sorted(
+        [
+            entry[: -len(test_ext)]
+            for entry in os.listdir(data_dir)
+            if not entry.startswith(".") and entry.endswith(test_ext)
+        ]
+    )
+
+    string_ids = {}
+    ids = []
+    index = {}
+    for test in tests:
+        with open(os.path.join(data_dir, f"{test}{test_ext}"), "r") as f:
+            encs = json.load(f)
+        index[test] = {}
+        for category, fields in encs.items():
+            index[test][category] = {"fields": {}, "texts": []}
+            for key, value in fields.items():
+                # Lists of texts are interned, other fields are kept as is.
+                if isinstance(value, list) and all(isinstance(v, str) for v in value):
+                    start = len(ids)
+                    for text in value:
+                        if "\0" in text:
+                            raise ValueError(f"NUL character in a text of {test}.")
+                        ids.append(string_ids.setdefault(text, len(string_ids)))
+                    value = [start, len(ids)]
+                    index[test][category]["texts"].append(key)
+                index[test][category]["fields"][key] = value
+
+    header = {"tests": index, "n_ids": len(ids)}
+    header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    strings = "\0".join(string_ids).encode("utf-8")
+    with open(path + ".tmp", "wb") as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(np.asarray(ids, dtype="<i4").tobytes())
+        f.write(strings)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load_suite(path):
+    """Load a suite written by `compile_suite` with a single read."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a compiled test suite.")
+    offset = len(MAGIC)
+    (header_length,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    header = json.loads(data[offset : offset + header_length].decode("utf-8"))
+    offset += header_length
+    ids = np.frombuffer(data, dtype="<i4", count=header["n_ids"], offset=offset)
+    offset += ids.nbytes
+    strings = data[offset:].decode("utf-8").split("\0")
+    return TestSuite(header, ids, strings)
@@ -1,11 +1,12 @@
 # Refers : https://github.com/McGill-NLP/bias-bench
 
-import itertools
+import concurrent.futures
 import math
+import os
+import statistics
 
 import numpy as np
-import scipy.special
-import scipy.stats
+from seat_bench.instrumentation import Timeline, log
 
 # X and Y are two sets of target words of equal size.
 # A and B are two sets of attribute words.
@@ -15,28 +16,110 @@ def cossim(x, y):
     return np.dot(x, y) / math.sqrt(np.dot(x, x) * np.dot(y, y))
 
 
-def construct_cossim_lookup(XY, AB):
+def _stack_vectors(vectors, dtype):
+    """Stack a mapping from int index to vector into a contiguous matrix whose
+    row i holds the vector stored under key i.
+    """
+    if isinstance(vectors, np.ndarray):
+        return np.ascontiguousarray(vectors, dtype=dtype)
+    return np.ascontiguousarray(
+        np.stack([vectors[i] for i in range(len(vectors))]), dtype=dtype
+    )
+
+
+def _normalize_rows(M):
+    """Scale every row of M to unit length in place. All-zero rows (OOV
+    vectors) are left as zeros, so their cosine similarity to anything is 0
+    instead of NaN.
+    """
+    norms = np.linalg.norm(M, axis=1, keepdims=True)
+    np.divide(M, norms, out=M, where=norms > 0)
+    return M
+
+
+def construct_cossim_lookup(XY, AB, dtype=np.float32, block_size=4096):
     """Args:
-        XY: Mapping from target string to target vector (either in X or Y).
-        AB: Mapping from attribute string to attribute vectore (either in A or B).
+        XY: Mapping from target index to target vector (either in X or Y), or
+            an array with one target vector per row.
+        AB: Mapping from attribute index to attribute vector (either in A or B),
+            or an array with one attribute vector per row.
+        dtype: Floating point type of the returned matrix (np.float32 or
+            np.float64).
+        block_size: Number of target rows normalized and multiplied at a time,
+            which bounds the temporary memory used for large inputs.
 
     Returns:
         An array of size (len(XY), len(AB)) containing cosine similarities
-        between items in XY and items in AB.
+        between items in XY and items in AB. Similarities involving an
+        all-zero vector are 0.
     """
-    cossims = np.zeros((len(XY), len(AB)))
-    for xy in XY:
-        for ab in AB:
-            cossims[xy, ab] = cossim(XY[xy], AB[ab])
+    AB = _normalize_rows(np.array(_stack_vectors(AB, dtype), dtype=dtype))
+    XY = _stack_vectors(XY, dtype)
+    cossims = np.empty((len(XY), len(AB)), dtype=dtype)
+    for start in range(0, len(XY), block_size):
+        block = _normalize_rows(np.array(XY[start : start + block_size], dtype=dtype))
+        np.matmul(block, AB.T, out=cossims[start : start + block_size])
     return cossims
 
 
+def _mean_unit_vector(M, rows, dtype, block_size):
+    """Return the mean of the given rows of M scaled to unit length, in
+    float64, normalizing block_size rows at a time.
+    """
+    rows = np.asarray(list(rows), dtype=np.int_)
+    total = np.zeros(M.shape[1], dtype=np.float64)
+    for start in range(0, len(rows), block_size):
+        block = M[rows[start : start + block_size]]
+        block = _normalize_rows(np.array(block, dtype=dtype))
+        total += block.sum(axis=0, dtype=np.float64)
+    return total / len(rows)
+
+
+def construct_centroid_lookup(XY, AB, A, B, dtype=np.float32, block_size=4096):
+    """Compute the mean cosine similarity of every target to A and to B
+    without the full similarity matrix.
+
+    For unit vectors, mean_{a in A} cos(w, a) is the dot product of w / |w|
+    with the mean of the unit vectors of A, so each target costs one
+    product with each of the two centroids. Targets and attributes are
+    normalized block_size rows at a time.
+
+    Args:
+        XY, AB, dtype: as in `construct_cossim_lookup`.
+        A, B: indices of the two attribute sets in AB.
+
+    Returns:
+        A float64 array of size (len(XY), 2) whose columns hold the mean
+        cosine similarity of each target to A and to B. It stands in for the
+        similarity matrix with A = [0] and B = [1], for which `s_wAB` gives
+        the same values as for the full matrix.
+    """
+    AB = _stack_vectors(AB, dtype)
+    centroids = np.stack(
+        [_mean_unit_vector(AB, rows, dtype, block_size) for rows in (A, B)]
+    )
+    XY = _stack_vectors(XY, dtype)
+    lookup = np.empty((len(XY), 2), dtype=np.float64)
+    for start in range(0, len(XY), block_size):
+        block = _normalize_rows(np.array(XY[start : start + block_size], dtype=dtype))
+        np.matmul(
+            block.astype(np.float64),
+            centroids.T,
+            out=lookup[start : start + block_size],
+        )
+    return lookup
+
+
 def s_wAB(A, B, cossims):
     """Returns:
     Vector of s(w, A, B) across w, where
         s(w, A, B) = mean_{a in A} cos(w, a) - mean_{b in B} cos(w, b).
     """
-    return cossims[:, A].mean(axis=1) - cossims[:, B].mean(axis=1)
+    # Accumulate in float64 so a float32 similarity matrix does not cost
+    # precision in the test statistic.
+    return cossims[:, A].mean(axis=1, dtype=np.float64) - cossims[:, B].mean(
+        axis=1, dtype=np.float64
+    )
 
 
 def s_XAB(X, s_wAB_memo):
@@ -79,10 +162,299 @@ def s_XYAB(X, Y, s_wAB_memo):
     return s_XAB(X, s_wAB_memo) - s_XAB(Y, s_wAB_memo)
 
 
-def p_val_permutation_test(X, Y, A, B, n_samples, cossims, parametric=False):
+def _permutation_blocks(XY, n_samples, rng, batch_size):
+    """Yield blocks of random permutations of XY.
+
+    Each block is an int array of shape (rows, len(XY)) whose rows are
+    independent uniform permutations; at most batch_size rows are held in
+    memory at once and n_samples rows are produced in total.
+    """
+    while n_samples > 0:
+        rows = min(batch_size, n_samples)
+        block = np.tile(XY, (rows, 1))
+        rng.permuted(block, axis=1, out=block)
+        yield block
+        n_samples -= rows
+
+
+# Number of permutations in the first block of the sequential test; later
+# blocks double in size up to batch_size.
+_SEQUENTIAL_BLOCK = 128
+
+
+def _wilson_interval(successes, total, confidence):
+    """Return the Wilson score interval of a binomial proportion."""
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    p = successes / total
+    denom = 1 + z**2 / total
+    center = (p + z**2 / (2 * total)) / denom
+    half = z * math.sqrt(p * (1 - p) / total + z**2 / (4 * total**2)) / denom
+    return max(center - half, 0.0), min(center + half, 1.0)
+
+
+def _sequential_test_counts(
+    s_wAB_memo,
+    XY,
+    size,
+    s,
+    n_samples,
+    rng,
+    batch_size,
+    alpha,
+    max_exceedances,
+    confidence,
+):
+    """Draw random partitions until the p-value is settled.
+
+    Sampling stops at the permutation producing the max_exceedances-th
+    partition with s(X_i, Y_i, A, B) >= s (Besag and Clifford, 1991), once
+    the confidence interval of the p-value excludes alpha, or after
+    n_samples permutations. Stopping rules are checked after each block of
+    permutations, and blocks double in size from `_SEQUENTIAL_BLOCK`.
+
+    Returns:
+        (total_true, total_equal, total, stopped_by), the counts of the
+        partitions drawn and the name of the rule that stopped sampling.
+    """
+    total_true = 0
+    total_equal = 0
+    total = 0
+    stopped_by = "n_samples"
+    block_size = min(_SEQUENTIAL_BLOCK, batch_size)
+    while total < n_samples:
+        rows = min(block_size, n_samples - total)
+        (block,) = _permutation_blocks(XY, rows, rng, rows)
+        si = s_wAB_memo[block[:, :size]].sum(axis=1)
+        exceeded = si >= s
+        counts = total_true + np.cumsum(exceeded)
+        if counts[-1] >= max_exceedances:
+            rows = int(np.argmax(counts >= max_exceedances)) + 1
+            stopped_by = "exceedances"
+        total_true += int(np.count_nonzero(exceeded[:rows]))
+        total_equal += int(np.count_nonzero(si[:rows] == s))
+        total += rows
+        if stopped_by == "exceedances":
+            break
+
+        low, high = _wilson_interval(total_true, total, confidence)
+        if high < alpha or low > alpha:
+            stopped_by = "alpha"
+            break
+        block_size = min(2 * block_size, batch_size)
+
+    return total_true, total_equal, total, stopped_by
+
+
+# Resolution of the fixed-point s(w, A, B) values used by the exact test.
+# Integer sums are independent of summation order, so ties between
+# partitions are detected exactly. Values are rounded to multiples of 2**-40
+# first, so partitions whose float scores differ only by rounding error (or
+# by less than the rounding step) count as ties, which the conservative test
+# counts towards the p-value. This is intended: a float enumeration splits
+# such ties depending on the summation order, so exact p-values can differ
+# slightly from those of a float enumeration when scores tie.
+_EXACT_SCALE = 2.0**40
+
+
+def _to_fixed_point(values):
+    return np.rint(np.asarray(values, dtype=np.float64) * _EXACT_SCALE).astype(np.int64)
+
+
+def _subset_sums(values):
+    """Return the sums and sizes of all 2 ** len(values) subsets of values.
+
+    Every subset sum is obtained from a previous one by adding a single
+    element, so building the table costs O(1) per subset.
+    """
+    sums = np.zeros(1, dtype=np.int64)
+    sizes = np.zeros(1, dtype=np.int64)
+    for value in values:
+        sums = np.concatenate((sums, sums + value))
+        sizes = np.concatenate((sizes, sizes + 1))
+    return sums, sizes
+
+
+def _count_matches(left, right, s):
+    """Count the pairs (l, r) of left sums and sorted right sums with
+    l + r >= s and l + r == s.
+    """
+    lo = np.searchsorted(right, s - left, side="left")
+    hi = np.searchsorted(right, s - left, side="right")
+    return (
+        int((len(right) - lo).sum()),
+        int((hi - lo).sum()),
+        len(left) * len(right),
+    )
+
+
+def _k_range(n_items, half, size):
+    """Numbers k of left-half items a partition of n_items can take."""
+    return range(max(0, size - (n_items - half)), min(size, half) + 1)
+
+
+def _exact_test_counts(values, size, s):
+    """Count the partitions of XY whose X side scores at least s.
+
+    Splits XY into two halves and enumerates the subset sums of each. A
+    partition takes k items from the left half and size - k from the right
+    one, so for every k the right sums are sorted once and each left sum is
+    matched with a binary search (meet in the middle).
+
+    Args:
+        values: fixed-point s(w, A, B) for every item of XY.
+        size: number of items on the X side of a partition.
+        s: fixed-point test statistic of the observed partition.
+
+    Returns:
+        (total_true, total_equal, total), the number of partitions scoring
+        >= s, == s and overall.
+    """
+    half = len(values) // 2
+    left_sums, left_sizes = _subset_sums(values[:half])
+    right_sums, right_sizes = _subset_sums(values[half:])
+
+    total_true = 0
+    total_equal = 0
+    total = 0
+    for k in _k_range(len(values), half, size):
+        left = left_sums[left_sizes == k]
+        right = np.sort(right_sums[right_sizes == size - k])
+        n_true, n_equal, n_total = _count_matches(left, right, s)
+        total_true += n_true
+        total_equal += n_equal
+        total += n_total
+    return total_true, total_equal, total
+
+
+# Per-process state of the exact test shard workers, set by
+# _init_exact_test_worker so the subset sum tables are built once per worker.
+_exact_test_worker = {}
+
+
+def _init_exact_test_worker(values, size, s, prefix):
+    half = len(values) // 2
+    rest_sums, rest_sizes = _subset_sums(values[prefix:half])
+    right_sums, right_sizes = _subset_sums(values[half:])
+    _exact_test_worker.clear()
+    _exact_test_worker.update(
+        n_items=len(values),
+        size=size,
+        s=s,
+        half=half,
+        rest_sums=rest_sums,
+        rest_sizes=rest_sizes,
+        right_sums=right_sums,
+        right_sizes=right_sizes,
+        sorted_right={},
+    )
+
+
+def _exact_test_shard(prefix_sum, prefix_size):
+    """Counts of _exact_test_counts restricted to the partitions that take
+    one fixed subset of the first items of the left half, whose sum and size
+    are prefix_sum and prefix_size.
+    """
+    state = _exact_test_worker
+    total_true = 0
+    total_equal = 0
+    total = 0
+    for k in _k_range(state["n_items"], state["half"], state["size"]):
+        left = state["rest_sums"][state["rest_sizes"] == k - prefix_size]
+        if not len(left):
+            continue
+        j = state["size"] - k
+        if j not in state["sorted_right"]:
+            state["sorted_right"][j] = np.sort(
+                state["right_sums"][state["right_sizes"] == j]
+            )
+        n_true, n_equal, n_total = _count_matches(
+            left + prefix_sum, state["sorted_right"][j], state["s"]
+        )
+        total_true += n_true
+        total_equal += n_equal
+        total += n_total
+    return total_true, total_equal, total
+
+
+def _exact_test_counts_parallel(values, size, s, n_jobs):
+    """_exact_test_counts sharded over n_jobs worker processes.
+
+    Each shard fixes which of the first few items of the left half are on
+    the X side, and builds the subset sums of the other left items with the
+    same vectorized tables as the serial engine. The integer counts of all
+    shards are summed, so the result is identical to the serial one.
+    """
+    half = len(values) // 2
+    # About four shards per worker, to balance uneven shards.
+    prefix = min(half, max(1, math.ceil(math.log2(4 * n_jobs))))
+    prefix_sums, prefix_sizes = _subset_sums(values[:prefix])
+
+    total_true = 0
+    total_equal = 0
+    total = 0
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=n_jobs,
+        initializer=_init_exact_test_worker,
+        initargs=(values, size, s, prefix),
+    ) as executor:
+        for n_true, n_equal, n_total in executor.map(
+            _exact_test_shard, prefix_sums.tolist(), prefix_sizes.tolist()
+        ):
+            total_true += n_true
+            total_equal += n_equal
+            total += n_total
+    return total_true, total_equal, total
+
+
+def _use_exact_test(size, n_samples, max_exact_partitions):
+    """Return whether the partitions of 2 * size targets are enumerated."""
+    num_partitions = math.comb(2 * size, size)
+    return num_partitions <= max(n_samples, max_exact_partitions or 0)
+
+
+def p_val_permutation_test(
+    X,
+    Y,
+    A,
+    B,
+    n_samples,
+    cossims,
+    parametric=False,
+    rng=None,
+    batch_size=10000,
+    max_exact_partitions=None,
+    n_jobs=1,
+    adaptive=False,
+    alpha=0.05,
+    max_exceedances=50,
+    confidence=0.99,
+    report=None,
+):
     """Compute the p-val for the permutation test, which is defined as
     the probability that a random even partition X_i, Y_i of X u Y
     satisfies P[s(X_i, Y_i, A, B) > s(X, Y, A, B)]
+
+    Random partitions are drawn from rng (a numpy.random.Generator, seeded
+    from the global numpy state when None) in blocks of batch_size
+    permutations, each of which is scored with a single gather-and-sum. The
+    draws depend only on the state of rng, not on batch_size.
+
+    The exact test is used when the number of partitions is at most
+    n_samples, or at most max_exact_partitions when that is given. With
+    n_jobs > 1 (or -1 for all CPUs) its enumeration is split across that
+    many processes. It scores partitions in fixed point (see `_EXACT_SCALE`),
+    so partitions whose scores tie up to rounding count as ties.
+
+    With adaptive, the non-parametric test samples sequentially (see
+    `_sequential_test_counts`) and draws at most n_samples permutations.
+    When stopped after max_exceedances exceedances in L permutations the
+    p-value is max_exceedances / L; otherwise it is biased by one as in the
+    fixed-size test.
+
+    When report is a dict, the number of permutations used ("n_permutations"),
+    the confidence interval of a sampled p-value ("p_value_ci") and, for the
+    adaptive test, the rule that stopped sampling ("stopped_by") are stored
+    in it.
     """
     X = np.array(list(X), dtype=np.int_)
     Y = np.array(list(Y), dtype=np.int_)
@@ -93,33 +465,36 @@ def p_val_permutation_test(X, Y, A, B, n_samples, cossims, parametric=False):
     size = len(X)
     s_wAB_memo = s_wAB(A, B, cossims=cossims)
     XY = np.concatenate((X, Y))
+    if rng is None:
+        rng = np.random.default_rng(np.random.randint(2**32, dtype=np.uint64))
 
     if parametric:
-        print("Using parametric test")
+        import scipy.stats
+
+        log("Using parametric test")
         s = s_XYAB(X, Y, s_wAB_memo)
 
-        print("Drawing {} samples".format(n_samples))
-        samples = []
-        for _ in range(n_samples):
-            np.random.shuffle(XY)
-            Xi = XY[:size]
-            Yi = XY[size:]
-            assert len(Xi) == len(Yi)
-            si = s_XYAB(Xi, Yi, s_wAB_memo)
-            samples.append(si)
+        log("Drawing {} samples".format(n_samples))
+        samples = np.empty(n_samples)
+        drawn = 0
+        for block in _permutation_blocks(XY, n_samples, rng, batch_size):
+            memo = s_wAB_memo[block]
+            si = memo[:, :size].sum(axis=1) - memo[:, size:].sum(axis=1)
+            samples[drawn : drawn + len(block)] = si
+            drawn += len(block)
 
         # Compute sample standard deviation and compute p-value by
         # assuming normality of null distribution
-        print("Inferring p-value based on normal distribution")
+        log("Inferring p-value based on normal distribution")
         (shapiro_test_stat, shapiro_p_val) = scipy.stats.shapiro(samples)
-        print(
+        log(
             "Shapiro-Wilk normality test statistic: {:.2g}, p-value: {:.2g}".format(
                 shapiro_test_stat, shapiro_p_val
             )
         )
         sample_mean = np.mean(samples)
         sample_std = np.std(samples, ddof=1)
-        print(
+        log(
             "Sample mean: {:.2g}, sample standard deviation: {:.2g}".format(
                 sample_mean, sample_std
             )
@@ -128,48 +503,73 @@ def p_val_permutation_test(X, Y, A, B, n_samples, cossims, parametric=False):
         return p_val
 
     else:
-        print("Using non-parametric test")
+        log("Using non-parametric test")
         s = s_XAB(X, s_wAB_memo)
         total_true = 0
         total_equal = 0
         total = 0
 
-        num_partitions = int(scipy.special.binom(2 * len(X), len(X)))
-        if num_partitions > n_samples:
+        num_partitions = math.comb(2 * len(X), len(X))
+        exact = _use_exact_test(len(X), n_samples, max_exact_partitions)
+        if not exact and adaptive:
+            log("Drawing at most {} samples (adaptive)".format(n_samples))
+            total_true, total_equal, total, stopped_by = _sequential_test_counts(
+                s_wAB_memo,
+                XY,
+                size,
+                s,
+                n_samples,
+                rng,
+                batch_size,
+                alpha,
+                max_exceedances,
+                confidence,
+            )
+            p_val_ci = _wilson_interval(total_true, total, confidence)
+            log("Drew {} samples (stopped by {})".format(total, stopped_by))
+            if stopped_by != "exceedances":
+                total_true += 1
+                total += 1
+
+        elif not exact:
             # We only have as much precision as the number of samples drawn;
             # bias the p-value (hallucinate a positive observation) to
             # reflect that.
             total_true += 1
             total += 1
-            print("Drawing {} samples (and biasing by 1)".format(n_samples - total))
-            for _ in range(n_samples - 1):
-                np.random.shuffle(XY)
-                Xi = XY[:size]
-                assert 2 * len(Xi) == len(XY)
-                si = s_XAB(Xi, s_wAB_memo)
-                if si > s:
-                    total_true += 1
-                elif si == s:  # use conservative test
-                    total_true += 1
-                    total_equal += 1
-                total += 1
+            log("Drawing {} samples (and biasing by 1)".format(n_samples - total))
+            for block in _permutation_blocks(XY, n_samples - 1, rng, batch_size):
+                si = s_wAB_memo[block[:, :size]].sum(axis=1)
+                # use conservative test: ties count towards the p-value
+                total_true += int(np.count_nonzero(si >= s))
+                total_equal += int(np.count_nonzero(si == s))
+                total += len(block)
+            p_val_ci = _wilson_interval(total_true, total, confidence)
 
         else:
-            print("Using exact test ({} partitions)".format(num_partitions))
-            for Xi in itertools.combinations(XY, len(X)):
-                Xi = np.array(Xi, dtype=np.int_)
-                assert 2 * len(Xi) == len(XY)
-                si = s_XAB(Xi, s_wAB_memo)
-                if si > s:
-                    total_true += 1
-                elif si == s:  # use conservative test
-                    total_true += 1
-                    total_equal += 1
-                total += 1
+            log("Using exact test ({} partitions)".format(num_partitions))
+            values = _to_fixed_point(s_wAB_memo[XY])
+            if n_jobs == -1:
+                n_jobs = os.cpu_count()
+            if n_jobs > 1:
+                total_true, total_equal, total = _exact_test_counts_parallel(
+                    values, size, values[:size].sum(), n_jobs
+                )
+            else:
+                total_true, total_equal, total = _exact_test_counts(
+                    values, size, values[:size].sum()
+                )
+            assert total == num_partitions
+            p_val_ci = (total_true / total, total_true / total)
 
         if total_equal:
-            print("Equalities contributed {}/{} to p-value".format(total_equal, total))
+            log("Equalities contributed {}/{} to p-value".format(total_equal, total))
 
+        if report is not None:
+            report["n_permutations"] = total
+            report["p_value_ci"] = list(p_val_ci)
+            if adaptive and not exact:
+                report["stopped_by"] = stopped_by
         return total_true / total
 
 
@@ -193,13 +593,131 @@ def effect_size(X, Y, A, B, cossims):
     A = list(A)
     B = list(B)
 
-    numerator = mean_s_wAB(X, A, B, cossims=cossims) - mean_s_wAB(
-        Y, A, B, cossims=cossims
-    )
-    denominator = stdev_s_wAB(X + Y, A, B, cossims=cossims)
+    s_wAB_memo = s_wAB(A, B, cossims)
+    numerator = np.mean(s_wAB_memo[X]) - np.mean(s_wAB_memo[Y])
+    denominator = np.std(s_wAB_memo[X + Y], ddof=1)
     return numerator / denominator
 
 
+def _bootstrap_indices(rng, n_boot, sets):
+    """Draw n_boot replicates of each index array in sets with replacement.
+
+    Each replicate takes one uniform double per index from rng, set after
+    set, so the replicates drawn do not depend on how many are drawn at once.
+
+    Returns:
+        `list` with a (n_boot, len(indices)) matrix for each of sets.
+    """
+    sizes = [len(indices) for indices in sets]
+    u = rng.random((n_boot, sum(sizes)))
+    draws = []
+    start = 0
+    for indices, size in zip(sets, sizes):
+        positions = (u[:, start : start + size] * size).astype(np.int_)
+        draws.append(indices[np.minimum(positions, size - 1)])
+        start += size
+    return draws
+
+
+def _resampled_means(cossims, columns, positions):
+    """Return the mean similarity of every target to each replicate of
+    columns, shape (replicates, targets).
+
+    A replicate only enters through how often it takes each column, so the
+    means are a product with the matrix of those counts, which needs no
+    (targets, replicates, columns) gather.
+    """
+    n_boot, size = positions.shape
+    flat = (np.arange(n_boot)[:, None] * size + positions).ravel()
+    counts = np.bincount(flat, minlength=n_boot * size).reshape(n_boot, size)
+    return counts @ cossims[:, columns].T.astype(np.float64) / size
+
+
+def _bootstrap_effect_sizes(X, Y, A, B, cossims, rng, n_boot, resample):
+    """Return the effect sizes of n_boot bootstrap replicates.
+
+    Every replicate is a row of an index matrix drawn with replacement, so
+    all replicates are scored at once by gathering s(w, A, B) and reducing
+    along the rows.
+    """
+    ranges = []
+    if resample in ("attributes", "both"):
+        ranges += [np.arange(len(A)), np.arange(len(B))]
+    if resample in ("targets", "both"):
+        ranges += [X, Y]
+    draws = _bootstrap_indices(rng, n_boot, ranges)
+
+    if resample in ("attributes", "both"):
+        A_boot, B_boot = draws[:2]
+        # s(w, A_r, B_r) for every replicate r and target w, shape (r, w).
+        s_boot = _resampled_means(cossims, A, A_boot) - _resampled_means(
+            cossims, B, B_boot
+        )
+    else:
+        s_boot = np.broadcast_to(s_wAB(A, B, cossims), (n_boot, len(cossims)))
+
+    if resample in ("targets", "both"):
+        X_boot, Y_boot = draws[-2:]
+    else:
+        X_boot = np.broadcast_to(X, (n_boot, len(X)))
+        Y_boot = np.broadcast_to(Y, (n_boot, len(Y)))
+
+    rows = np.arange(n_boot)[:, None]
+    sX = s_boot[rows, X_boot]
+    sY = s_boot[rows, Y_boot]
+    numerator = sX.mean(axis=1) - sY.mean(axis=1)
+    denominator = np.concatenate((sX, sY), axis=1).std(axis=1, ddof=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return numerator / denominator
+
+
+def effect_size_ci(
+    X,
+    Y,
+    A,
+    B,
+    cossims,
+    n_boot=1000,
+    confidence=0.95,
+    resample="targets",
+    rng=None,
+    batch_size=1000,
+):
+    """Compute a percentile bootstrap confidence interval of the effect size.
+    Args:
+        X, Y, A, B : sets of target (X, Y) and attribute (A, B) indices
+        n_boot (int): number of bootstrap replicates
+        confidence (float): coverage of the interval
+        resample (str): words resampled with replacement in each replicate,
+            one of "targets", "attributes" or "both"
+        rng (numpy.random.Generator): source of the replicates
+        batch_size (int): number of replicates evaluated at once; the
+            replicates drawn from rng do not depend on it
+    Returns:
+        (low, high) bounds of the interval. Replicates whose s(w, A, B) values
+        are all equal have no effect size and are left out.
+    """
+    if resample not in ("targets", "attributes", "both"):
+        raise ValueError(f"Unknown bootstrap resampling: {resample}")
+    X = np.array(list(X), dtype=np.int_)
+    Y = np.array(list(Y), dtype=np.int_)
+    A = np.array(list(A), dtype=np.int_)
+    B = np.array(list(B), dtype=np.int_)
+    if rng is None:
+        rng = np.random.default_rng(np.random.randint(2**32, dtype=np.uint64))
+
+    esizes = np.concatenate(
+        [
+            _bootstrap_effect_sizes(
+                X, Y, A, B, cossims, rng, min(batch_size, n_boot - start), resample
+            )
+            for start in range(0, n_boot, batch_size)
+        ]
+    )
+    low, high = np.nanquantile(esizes, [(1 - confidence) / 2, (1 + confidence) / 2])
+    return float(low), float(high)
+
+
 def convert_keys_to_ints(X, Y):
     return (
         dict((i, v) for (i, (k, v)) in enumerate(X.items())),
@@ -207,34 +725,134 @@ def convert_keys_to_ints(X, Y):
     )
 
 
-def run_test(encs, n_samples, parametric=False):
+def _stack_pair(X, Y):
+    """Stack the encodings of X and Y into one matrix.
+
+    Returns:
+        The matrix and the row indices of X and of Y in it.
+    """
+    X, Y = (np.stack(list(Z.values())) if isinstance(Z, dict) else Z for Z in (X, Y))
+    return np.concatenate((X, Y)), range(len(X)), range(len(X), len(X) + len(Y))
+
+
+def run_test(
+    encs,
+    n_samples,
+    parametric=False,
+    dtype=np.float32,
+    rng=None,
+    max_exact_partitions=None,
+    n_jobs=1,
+    adaptive=False,
+    alpha=0.05,
+    n_bootstrap=0,
+    bootstrap="targets",
+    centroid=False,
+    return_report=False,
+):
     """Run a WEAT.
     Args:
         encs (Dict[str: Dict]): dictionary mapping targ1, targ2, attr1, attr2
-            to dictionaries containing the category and the encodings
+            to dictionaries containing the category and the encodings, either
+            as a mapping from text to vector or as a matrix with one vector
+            per row
         n_samples (int): number of samples to draw to estimate p-value
             (use exact test if number of permutations is less than or
             equal to n_samples)
+        dtype: floating point type used for the cosine similarity matrix
+        rng (numpy.random.Generator): source of the permutation samples
+        max_exact_partitions (int): also use the exact test when the number
+            of permutations is at most this many
+        n_jobs (int): number of processes used by the exact test
+        adaptive (bool): stop sampling permutations early once the p-value
+            is settled relative to alpha
+        alpha (float): significance level the adaptive test decides against
+        n_bootstrap (int): number of bootstrap replicates of the 95%
+            confidence interval of the effect size (none when 0), drawn from
+            rng after the permutation test
+        bootstrap (str): words resampled by the bootstrap, one of "targets",
+            "attributes" or "both"
+        centroid (bool): score targets against the mean unit vectors of the
+            attribute sets instead of building the full cosine similarity
+            matrix, see `construct_centroid_lookup`; needs O(n * d) time and
+            memory instead of O(n^2 * d), but the attributes cannot be
+            bootstrapped
+        return_report (bool): also return a dict with the number of
+            permutations used, the precision of the p-value, the confidence
+            interval of the effect size, the wall time and peak RSS of each
+            phase ("timings") and the phase events ("trace", see
+            `instrumentation.Timeline`)
+    """
+    ((esize, pval, report),) = run_test_seeds(
+        encs,
+        n_samples,
+        [rng],
+        parametric=parametric,
+        dtype=dtype,
+        max_exact_partitions=max_exact_partitions,
+        n_jobs=n_jobs,
+        adaptive=adaptive,
+        alpha=alpha,
+        n_bootstrap=n_bootstrap,
+        bootstrap=bootstrap,
+        centroid=centroid,
+    )
+    if return_report:
+        return esize, pval, report
+    return esize, pval
+
+
+def run_test_seeds(
+    encs,
+    n_samples,
+    rngs,
+    parametric=False,
+    dtype=np.float32,
+    max_exact_partitions=None,
+    n_jobs=1,
+    adaptive=False,
+    alpha=0.05,
+    n_bootstrap=0,
+    bootstrap="targets",
+    centroid=False,
+):
+    """Run a WEAT once for each generator in rngs.
+
+    The cosine similarities and the effect size are computed once and only
+    the permutation test and the bootstrap are repeated per generator. When
+    the exact test applies its p-value does not depend on the generator, so
+    it is computed only once too. The other arguments are those of
+    `run_test`.
+
+    Returns:
+        `list` with the (effect size, p-value, report) triple of each
+        generator, as returned by `run_test` with return_report.
     """
     X, Y = encs["targ1"]["encs"], encs["targ2"]["encs"]
     A, B = encs["attr1"]["encs"], encs["attr2"]["encs"]
-    print(len(X), len(Y), len(A), len(B))
+    log(len(X), len(Y), len(A), len(B))
     # print(X.keys(), len(X))
     # print(Y.keys(), len(Y))
 
-    # First convert all keys to ints to facilitate array lookups
-    (X, Y) = convert_keys_to_ints(X, Y)
-    (A, B) = convert_keys_to_ints(A, B)
-
-    XY = X.copy()
-    XY.update(Y)
-    AB = A.copy()
-    AB.update(B)
-
-    print("Computing cosine similarities...")
-    cossims = construct_cossim_lookup(XY, AB)
+    # First stack the encodings so items are looked up by row index
+    XY, X, Y = _stack_pair(X, Y)
+    AB, A, B = _stack_pair(A, B)
+
+    timeline = Timeline()
+    if centroid:
+        if n_bootstrap and bootstrap != "targets":
+            raise ValueError("Only the targets can be bootstrapped with centroid.")
+        log("Computing centroid similarities...")
+        with timeline.phase("cossims"):
+            cossims = construct_centroid_lookup(XY, AB, A, B, dtype=dtype)
+        # The columns of the lookup stand in for the attribute sets.
+        A, B = [0], [1]
+    else:
+        log("Computing cosine similarities...")
+        with timeline.phase("cossims"):
+            cossims = construct_cossim_lookup(XY, AB, dtype=dtype)
 
-    print(
+    log(
         "Null hypothesis: no difference between {} and {} in association to attributes {} and {}".format(
             encs["targ1"]["category"],
             encs["targ2"]["category"],
@@ -242,18 +860,58 @@ def run_test(encs, n_samples, parametric=False):
             encs["attr2"]["category"],
         )
     )
-    print("Computing pval...")
-    pval = p_val_permutation_test(
-        X, Y, A, B, n_samples, cossims=cossims, parametric=parametric
-    )
-    print(f"pval: {pval:.3f}")
-
-    print("computing effect size...")
-    esize = effect_size(X, Y, A, B, cossims=cossims)
-    print(f"esize: {esize:.3f}")
-    return esize, pval
-
-
+    exact = not parametric and _use_exact_test(len(X), n_samples, max_exact_partitions)
+    pvals = []
+    reports = []
+    for run, rng in enumerate(rngs):
+        if exact and pvals:
+            pvals.append(pvals[0])
+            reports.append(dict(reports[0]))
+            continue
+        log("Computing pval...")
+        report = {}
+        with timeline.phase("p_value", run=run):
+            pval = p_val_permutation_test(
+                X,
+                Y,
+                A,
+                B,
+                n_samples,
+                cossims=cossims,
+                parametric=parametric,
+                rng=rng,
+                max_exact_partitions=max_exact_partitions,
+                n_jobs=n_jobs,
+                adaptive=adaptive,
+                alpha=alpha,
+                report=report,
+            )
+        log(f"pval: {pval:.3f}")
+        pvals.append(pval)
+        reports.append(report)
+
+    log("computing effect size...")
+    with timeline.phase("effect_size"):
+        esize = effect_size(X, Y, A, B, cossims=cossims)
+    log(f"esize: {esize:.3f}")
+    if n_bootstrap:
+        log("computing effect size confidence interval...")
+        for run, (rng, report) in enumerate(zip(rngs, reports)):
+            with timeline.phase("effect_size_ci", run=run):
+                low, high = effect_size_ci(
+                    X, Y, A, B, cossims, n_boot=n_bootstrap, resample=bootstrap, rng=rng
+                )
+            report["effect_size_ci"] = [low, high]
+            log(f"esize 95% CI: [{low:.3f}, {high:.3f}]")
+
+    for run, report in enumerate(reports):
+        report["timings"] = timeline.summary(run=run)
+        report["trace"] = timeline.events
+    return [(esize, pval, report) for pval, report in zip(pvals, reports)]
+
+
+# Run from src as `python -m seat_bench.weat`, so the seat_bench imports
+# resolve; see check_weat.py for a check of the exact test engines.
 if __name__ == "__main__":
     X = {"x" + str(i): 2 * np.random.rand(10) - 1 for i in range(25)}
     Y = {"y" + str(i): 2 * np.random.rand(10) - 1 for i in range(25)}
@@ -273,8 +931,9 @@ if __name__ == "__main__":
     cossims = construct_cossim_lookup(XY, AB)
     print("computing pval...")
     pval = p_val_permutation_test(X, Y, A, B, cossims=cossims, n_samples=10000)
-    print("pval: %g".format(pval))
+    print(f"pval: {pval:g}")
 
     print("computing effect size...")
     esize = effect_size(X, Y, A, B, cossims=cossims)
-    print("esize: %g".format(esize))
+    print(f"esize: {esize:g}")
+
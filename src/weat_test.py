@@ -1,7 +1,8 @@
 # Refers : https://github.com/McGill-NLP/bias-bench
 
 from seat_bench.seat import WEATRunner
-from seat_bench.experiment_id import generate_experiment_id
+from seat_bench.instrumentation import log, set_quiet
+from seat_bench.matrix import experiment_paths
 
 import argparse
 import json
@@ -32,11 +33,62 @@ parser.add_argument(
     help="Number of permutation test samples used when estimating p-values "
     "(exact test is used if there are fewer than this many permutations).",
 )
+parser.add_argument(
+    "--max_exact_partitions",
+    action="store",
+    type=int,
+    default=None,
+    help="Use the exact test whenever there are at most this many permutations, "
+    "even if there are more than n_samples.",
+)
 parser.add_argument(
     "--parametric",
     action="store_true",
     help="Use parametric test (normal assumption) to compute p-values.",
 )
+parser.add_argument(
+    "--adaptive",
+    action="store_true",
+    help="Stop drawing permutation test samples once the p-value is clearly "
+    "above or below --alpha (at most n_samples are drawn).",
+)
+parser.add_argument(
+    "--alpha",
+    action="store",
+    type=float,
+    default=0.05,
+    help="Significance level used by the adaptive permutation test.",
+)
+parser.add_argument(
+    "--n_bootstrap",
+    action="store",
+    type=int,
+    default=1000,
+    help="Number of bootstrap replicates of the 95%% confidence interval of the "
+    "effect size (0 disables it).",
+)
+parser.add_argument(
+    "--bootstrap",
+    action="store",
+    type=str,
+    default="targets",
+    choices=["targets", "attributes", "both"],
+    help="Words resampled with replacement by the effect size bootstrap.",
+)
+parser.add_argument(
+    "--centroid",
+    action="store_true",
+    help="Score targets against the mean unit vector of each attribute set "
+    "instead of building the full cosine similarity matrix, for very large "
+    "word sets (only the targets can be bootstrapped).",
+)
+parser.add_argument(
+    "--language",
+    action="store",
+    type=str,
+    default="hi",
+    help="Language of the tests, a directory of data/weat.",
+)
 parser.add_argument(
     "--mode",
     action="store",
@@ -52,52 +104,138 @@ parser.add_argument(
     default=0,
     help="Random seed used for reproducibility.",
 )
+parser.add_argument(
+    "--seeds",
+    action="store",
+    type=int,
+    nargs="*",
+    help="Random seeds of a sweep that encodes every test once and reports one "
+    "result per seed (overrides --seed).",
+)
 parser.add_argument(
     "--embedding_model",
     action="store",
     type=str,
-    default="fasttext",
+    default="glove",
     choices=["fasttext", "glove"],
     help="Embedding model to use.",
 )
+parser.add_argument(
+    "--n_jobs",
+    action="store",
+    type=int,
+    default=1,
+    help="Number of tests run in parallel processes (-1 uses all CPUs).",
+)
+parser.add_argument(
+    "--cache_dir",
+    action="store",
+    type=str,
+    default=None,
+    help="Directory of the on-disk encoding cache reused across runs.",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Skip tests already recorded in the streamed .jsonl results of this "
+    "experiment, seed and configuration.",
+)
+parser.add_argument(
+    "--overwrite",
+    action="store_true",
+    help="Discard the results already in the .jsonl results of this experiment. "
+    "Without it or --resume, a run stops rather than discard them.",
+)
+parser.add_argument(
+    "--prune_vocab",
+    action="store_true",
+    help="Load only the GloVe vectors of the words in the selected tests, "
+    "reading the whole embedding file.",
+)
+parser.add_argument(
+    "--suite",
+    action="store",
+    type=str,
+    default=None,
+    help="Test suite compiled from the data directory by compile_tests.py, "
+    "loaded instead of the test files (recompile it after editing the tests).",
+)
+parser.add_argument(
+    "--quiet",
+    action="store_true",
+    help="Do not print progress messages.",
+)
+parser.add_argument(
+    "--trace",
+    action="store",
+    type=str,
+    default=None,
+    help="File the wall time and peak RSS of each phase are written to, as a "
+    "Chrome trace.",
+)
+
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    args.persistent_dir = DIRECTORY
-    args.tests = None
-    args.n_samples = 1000
-    args.parametric = False
-    args.mode = "lang_spec"
-    args.seed = 0
-    args.embedding_model = "glove"
 
-    experiment_id = generate_experiment_id(
-        name=f"weat_all_{args.mode}_{args.embedding_model}"
+    set_quiet(args.quiet)
+    data_dir, results_dir, experiment_id = experiment_paths(
+        args.persistent_dir, "weat", args.language, args.mode, args.embedding_model
     )
 
-    print("Running WEAT benchmark:")
-    print(f" - persistent_dir: {args.persistent_dir}")
-    print(f" - tests: {args.tests}")
-    print(f" - n_samples: {args.n_samples}")
-    print(f" - parametric: {args.parametric}")
-    print(f" - seed: {args.seed}")
-    print(f" - mode: {args.mode}")
-    print(f" - embedding_model: {args.embedding_model}")
+    log("Running WEAT benchmark:")
+    log(f" - persistent_dir: {args.persistent_dir}")
+    log(f" - tests: {args.tests}")
+    log(f" - n_samples: {args.n_samples}")
+    log(f" - max_exact_partitions: {args.max_exact_partitions}")
+    log(f" - parametric: {args.parametric}")
+    log(f" - adaptive: {args.adaptive}")
+    log(f" - alpha: {args.alpha}")
+    log(f" - n_bootstrap: {args.n_bootstrap}")
+    log(f" - bootstrap: {args.bootstrap}")
+    log(f" - centroid: {args.centroid}")
+    log(f" - seed: {args.seed}")
+    log(f" - seeds: {args.seeds}")
+    log(f" - language: {args.language}")
+    log(f" - mode: {args.mode}")
+    log(f" - embedding_model: {args.embedding_model}")
+    log(f" - n_jobs: {args.n_jobs}")
+    log(f" - cache_dir: {args.cache_dir}")
+    log(f" - resume: {args.resume}")
+    log(f" - overwrite: {args.overwrite}")
+    log(f" - prune_vocab: {args.prune_vocab}")
+    log(f" - suite: {args.suite}")
+
+    os.makedirs(results_dir, exist_ok=True)
 
     runner = WEATRunner(
         experiment_id=experiment_id,
         tests=args.tests,
-        data_dir=f"{args.persistent_dir}/data/weat/hi/{args.mode}",
+        data_dir=data_dir,
         n_samples=args.n_samples,
+        max_exact_partitions=args.max_exact_partitions,
         parametric=args.parametric,
+        adaptive=args.adaptive,
+        alpha=args.alpha,
+        n_bootstrap=args.n_bootstrap,
+        bootstrap=args.bootstrap,
+        centroid=args.centroid,
         seed=args.seed,
+        seeds=args.seeds,
         embedding_model=args.embedding_model,
+        n_jobs=args.n_jobs,
+        cache_dir=args.cache_dir,
+        results_path=f"{results_dir}/{experiment_id}.jsonl",
+        resume=args.resume,
+        overwrite=args.overwrite,
+        quiet=args.quiet,
+        prune_vocab=args.prune_vocab,
+        suite_path=args.suite,
     )
     results = runner()
-    print(results)
+    log(results)
+    if args.trace:
+        runner.write_trace(args.trace)
 
-    os.makedirs(f"{args.persistent_dir}/results/weat/hi/{args.mode}", exist_ok=True)
-    with open(
-        f"{args.persistent_dir}/results/weat/hi/{args.mode}/{experiment_id}.json", "w"
-    ) as f:
+    with open(f"{results_dir}/{experiment_id}.json", "w") as f:
         json.dump(results, f, indent=4)